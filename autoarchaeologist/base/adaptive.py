@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+    AutoArchaeologist Adaptive Examiner Ordering
+    --------------------------------------------
+
+    Examination of an artifact stops at the first examiner which
+    takes it, so the order of the examiners determines the cost.
+
+    With `Excavation(adaptive_order=True)` the rate at which each
+    examiner takes artifacts, and its mean cost, are recorded per
+    artifact features: The size bucket (log2 of the length), the
+    examiner which created the artifact and the media type, and
+    saved in the "Adaptive" subdirectory of the cache_dir.
+
+    Examination of an artifact stops at the first examiner which
+    takes it, so examiners which have ever taken an artifact keep
+    their place, and the order in which they were added decides
+    which of them gets an artifact, as without adaptive ordering.
+
+    On later runs the examiners which never take anything are
+    ordered by cost in the gaps between those, cheapest first, but
+    examiners which have not been seen `MIN_CALLS` times with the
+    features of the artifact go first in their gap, in the order
+    they were added.
+
+    Examiners which must run after other examiners, for instance
+    because they use the notes those add, declare it:
+
+        class R1kSegHeap():
+            AFTER = (R1k6ZeroSegment,)
+'''
+
+import os
+import json
+
+def examiner_name(examiner):
+    ''' The name used for an examiner '''
+    return examiner.__module__ + "." + examiner.__qualname__
+
+class AdaptiveOrder():
+    ''' Record take-rates and order the examiners accordingly '''
+
+    # How many calls before we trust the take-rate
+    MIN_CALLS = 20
+
+    def __init__(self, top, path):
+        self.top = top
+        self.filename = os.path.join(path, top.__class__.__name__ + ".json")
+        self.history = {}
+        self.current = {}
+        self.orders = {}
+        self.takers = None
+        try:
+            with open(self.filename, encoding="utf8") as file:
+                self.history = json.load(file)
+        except FileNotFoundError:
+            pass
+        except ValueError as err:
+            print("Adaptive order history ignored", self.filename, err)
+
+    def features(self, this):
+        ''' The key for the features of an artifact '''
+        if this.created_by is None:
+            creator = "-"
+        else:
+            creator = examiner_name(this.created_by)
+        return "%d:%s:%s" % (len(this).bit_length(), creator, this.media_type)
+
+    def record(self, this, examiner, elapsed, took):
+        ''' Account for one call '''
+        i = self.current.setdefault(self.features(this), {})
+        j = i.setdefault(examiner_name(examiner), [0, 0, 0.0])
+        j[0] += 1
+        if took:
+            j[1] += 1
+            if self.takers is not None and examiner_name(examiner) not in self.takers:
+                self.takers.add(examiner_name(examiner))
+                self.orders = {}
+        j[2] += elapsed
+
+    def has_taken(self, examiner):
+        ''' Has the examiner ever taken an artifact ? '''
+        if self.takers is None:
+            self.takers = set()
+            for stats in (self.history, self.current):
+                for examiners in stats.values():
+                    for name, (_calls, takes, _elapsed) in examiners.items():
+                        if takes:
+                            self.takers.add(name)
+        return examiner_name(examiner) in self.takers
+
+    def cost(self, key, examiner):
+        ''' Mean seconds per call or None if we do not know '''
+        calls, _takes, elapsed = self.history.get(key, {}).get(
+            examiner_name(examiner),
+            (0, 0, 0.0)
+        )
+        if calls < self.MIN_CALLS:
+            return None
+        return elapsed / calls
+
+    def order(self, this, table):
+        '''
+           Order a table of (n, examiner, precondition)
+
+           The table is in the order examiners were added, and that
+           order is kept for examiners we know nothing about.
+        '''
+        key = self.features(this)
+        okey = (key, tuple(x[0] for x in table))
+        retval = self.orders.get(okey)
+        if retval is not None:
+            return retval
+
+        retval = []
+        gap = []
+        for entry in table:
+            if self.has_taken(entry[1]):
+                retval += self.order_gap(key, gap, table)
+                retval.append(entry)
+                gap = []
+            else:
+                gap.append(entry)
+        retval += self.order_gap(key, gap, table)
+        self.orders[okey] = retval
+        return retval
+
+    def order_gap(self, key, gap, table):
+        ''' Order examiners which never take, between two which do '''
+        unknown = []
+        known = []
+        for entry in gap:
+            cost = self.cost(key, entry[1])
+            if cost is None:
+                unknown.append(entry)
+            else:
+                known.append((cost, entry[0], entry))
+        todo = unknown + [x[-1] for x in sorted(known)]
+
+        # Respect the declared AFTER constraints
+        retval = []
+        placed = set()
+        present = {x[1] for x in table}
+        while todo:
+            for n, entry in enumerate(todo):
+                after = getattr(entry[1], "AFTER", ())
+                if all(x in placed or x not in present for x in after):
+                    break
+            else:
+                # A loop, give up on constraints
+                n = 0
+            entry = todo.pop(n)
+            retval.append(entry)
+            placed.add(entry[1])
+        return retval
+
+    def merge(self, other):
+        ''' Add in the statistics from another process '''
+        for key, examiners in other.items():
+            i = self.current.setdefault(key, {})
+            for name, stats in examiners.items():
+                j = i.setdefault(name, [0, 0, 0.0])
+                for n, val in enumerate(stats):
+                    j[n] += val
+        # New takers may have been seen
+        self.takers = None
+        self.orders = {}
+
+    def save(self):
+        ''' Add the statistics from this run to the history '''
+        for key, examiners in self.current.items():
+            i = self.history.setdefault(key, {})
+            for name, stats in examiners.items():
+                j = i.setdefault(name, [0, 0, 0.0])
+                for n, val in enumerate(stats):
+                    j[n] += val
+        self.current = {}
+        tmpname = self.filename + ".tmp.%d" % os.getpid()
+        with open(tmpname, "w", encoding="utf8") as file:
+            json.dump(self.history, file, indent=1, sort_keys=True)
+            file.write("\n")
+        os.rename(tmpname, self.filename)
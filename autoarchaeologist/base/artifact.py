@@ -11,13 +11,20 @@
 '''
 
 import os
+import sys
+import array
+import bisect
+import operator
+import collections
 import hashlib
 import html
 import mmap
 
-from itertools import zip_longest
-
+from . import bitstring
 from . import octetview as ov
+from . import artifact_stats
+from . import sectormap
+from . import wordview
 from . import result_page
 
 class Unread():
@@ -36,6 +43,36 @@ class Unread():
 
 unread = Unread()
 
+def digest_of(octets):
+    ''' SHA256 hex digest, contiguous buffers are hashed in place '''
+    if isinstance(octets, memoryview) and not octets.c_contiguous:
+        octets = octets.tobytes()
+    return hashlib.sha256(octets).hexdigest()
+
+def same_octets(a, b, chunk=1<<16):
+    '''
+       Compare two buffers, without copying all of them
+
+       Comparing memoryviews goes item by item, a bytearray compares
+       with any buffer in place, so chunks of one buffer are copied
+       into a scratch bytearray and compared to the other in place.
+    '''
+    if len(a) != len(b):
+        return False
+    if not len(a):
+        return True
+    a = memoryview(a).cast('B')
+    b = memoryview(b).cast('B')
+    chunk = min(chunk, len(a))
+    scratch = bytearray(chunk)
+    view = memoryview(scratch)
+    for i in range(0, len(a) - chunk + 1, chunk):
+        view[:] = a[i:i+chunk]
+        if scratch != b[i:i+chunk]:
+            return False
+    tail = len(a) % chunk
+    return not tail or bytearray(a[-tail:]) == b[-tail:]
+
 class Record():
     '''
        A piece of an artifact
@@ -69,6 +106,144 @@ class Record():
     def __getitem__(self, idx):
         return self.frag[idx]
 
+class RecordTable():
+    '''
+       The records of an artifact
+       --------------------------
+
+       The extents and keys are kept in columns, `Record` objects
+       are only made when first asked for, and then kept, so they
+       stay the same object, with any attributes set on them.
+
+       The index from keys to rows is built on the first lookup.
+    '''
+
+    def __init__(self, artifact=None):
+        self.artifact = artifact
+        self.lo = array.array('q')
+        self.hi = array.array('q')
+        self.keys = []
+        self.unread = bytearray()
+        self.objs = {}		# row -> Record
+        self.index = None	# key -> row
+        self.key_len = 0
+        self.key_min = []
+        self.key_max = []
+        self.reclens = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["index"] = None
+        return state
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return self.row(key) is not None
+
+    def __iter__(self):
+        for row in range(len(self.keys)):
+            yield self.record(row)
+
+    def __getitem__(self, key):
+        row = self.row(key)
+        if row is None:
+            raise KeyError(key)
+        return self.record(row)
+
+    def get(self, key):
+        ''' The Record with key, or None '''
+        row = self.row(key)
+        if row is None:
+            return None
+        return self.record(row)
+
+    def row(self, key):
+        ''' The row of a key, or None '''
+        if self.index is None:
+            self.index = dict(zip(self.keys, range(len(self.keys))))
+        return self.index.get(key)
+
+    def record(self, row):
+        ''' The Record in a row '''
+        rec = self.objs.get(row)
+        if rec is None:
+            lo = self.lo[row]
+            hi = self.hi[row]
+            rec = Record(lo, hi, frag=self.artifact[lo:hi], key=self.keys[row])
+            rec.artifact = self.artifact
+            rec.undefined = bool(self.unread[row])
+            self.objs[row] = rec
+        return rec
+
+    def valid_keys(self, keys):
+        ''' Would `check_keys()` accept these keys ? '''
+        if len(set(keys)) != len(keys) or (self.keys and any(x in self for x in keys)):
+            return False
+        if self.keys:
+            key_len = self.key_len
+        else:
+            key_len = len(keys[0])
+        return all(len(x) == key_len for x in keys)
+
+    def check_keys(self, keys):
+        ''' Check for duplicates and key lengths, update the key range '''
+        if len(set(keys)) != len(keys) or (self.keys and any(x in self for x in keys)):
+            dups = [x for x in keys if x in self or keys.count(x) > 1]
+            print("Duplicate key:", dups[0])
+            assert not dups
+        if not self.keys:
+            self.key_len = len(keys[0])
+            self.key_min = list(keys[0])
+            self.key_max = list(keys[0])
+        lengths = set(map(len, keys))
+        if lengths != {self.key_len}:
+            print(
+                self.artifact,
+                "Records have different key lengths:",
+                self.key_len,
+                lengths,
+            )
+            assert lengths == {self.key_len}
+        for i, column in enumerate(zip(*keys)):
+            self.key_min[i] = min(self.key_min[i], min(column))
+            self.key_max[i] = max(self.key_max[i], max(column))
+
+    def define(self, rec):
+        ''' Add a Record '''
+        self.check_keys((rec.key,))
+        if self.index is None:
+            self.row(rec.key)
+        row = len(self.keys)
+        self.lo.append(rec.lo)
+        self.hi.append(rec.hi)
+        self.keys.append(rec.key)
+        self.unread.append(unread == rec.frag)
+        self.index[rec.key] = row
+        self.objs[row] = rec
+        self.reclens[len(rec)] = self.reclens.get(len(rec), 0) + 1
+
+    def define_bulk(self, keys, los, his, octets):
+        ''' Add rows of (key, lo, hi), where octets are those of the artifact '''
+        if not keys:
+            return
+        if len(keys) > 1 and not self.valid_keys(keys):
+            # One by one, so the rows before the offending key are kept
+            for i in range(len(keys)):
+                self.define_bulk(keys[i:i+1], los[i:i+1], his[i:i+1], octets)
+            return
+        self.check_keys(keys)
+        row = len(self.keys)
+        self.lo.extend(los)
+        self.hi.extend(his)
+        self.keys += keys
+        self.unread += sectormap.SectorMap(octets, los, his, uniform=False).flags
+        if self.index is not None:
+            self.index.update(zip(keys, range(row, len(self.keys))))
+        for length, count in collections.Counter(map(operator.sub, his, los)).items():
+            self.reclens[length] = self.reclens.get(length, 0) + count
+
 class Artifact(result_page.ResultPage):
 
     '''
@@ -113,19 +288,20 @@ class Artifact(result_page.ResultPage):
         self.type_case = None
 
         self.top = None
+        self.created_by = None	# The examiner which created this artifact
 
         self.link_to = ""
         self.byte_order = None
+        self.swapped_order = None	# The byte_order of .swapped_octets
+        self.words_order = None		# The (width, endian) of .words_octets
+        self.octet_stats = None
+        self.media_type = None
         self.namespaces = {}
         self.names = set()
         self.ns_roots = []
 
         self.by_class = {} # Experimental extension point
-        self._keys = {}
-        self._reclens = {}
-        self._key_min = []
-        self._key_max = []
-        self._key_len = 0
+        self._records = RecordTable(self)
 
         self.metrics = None # Used only for toplevel artifacts
 
@@ -149,7 +325,7 @@ class Artifact(result_page.ResultPage):
 
     def get_frag(self, key):
         ''' Get a fragment by key '''
-        retval = self._keys.get(key)
+        retval = self._records.get(key)
         if retval is None or retval.undefined:
             return None
         return retval
@@ -161,43 +337,72 @@ class Artifact(result_page.ResultPage):
             yield from self
             return
 
-        def group(data, chunk):
-            i = [iter(data)] * chunk
-            return zip_longest(*i, fillvalue=0)
+        yield from self.swapped()
+
+    def swapped(self):
+        ''' The octets in byte-order, computed once per byte-order '''
+        order = tuple(self.byte_order)
+        retval = self.__dict__.get("swapped_octets")
+        if retval is None or order != self.swapped_order:
+            retval = memoryview(
+                b''.join(ov.reorder(x, order) for x in self.iter_chunks())
+            ).toreadonly()
+            self.swapped_octets = retval
+            self.swapped_order = order
+        return retval
 
-        for chunk in self.iter_chunks():
-            for i in group(chunk, len(self.byte_order)):
-                for j in self.byte_order:
-                    yield i[j]
+    def words(self, width=16, endian="big", lo=0, hi=None):
+        '''
+           Get [lo:hi] as a WordView of `width` bit words, by default
+           up to the last whole word
+
+           Byte-swapped octets are cached for the entire artifact
+           and one (width, endian) at a time.
+        '''
+        size = width >> 3
+        if hi is None:
+            hi = lo + (len(self) - lo) // size * size
+        assert not (hi - lo) % size
+        if endian == sys.byteorder:
+            return wordview.WordView(self[lo:hi], width, endian)
+        if lo % size:
+            octets = wordview.swapped_octets(self[lo:hi], width)
+            return wordview.WordView(octets, width, endian)
+        octets = self.__dict__.get("words_octets")
+        if octets is None or self.words_order != (width, endian):
+            octets = wordview.swapped_octets(
+                self[:len(self) // size * size],
+                width
+            )
+            self.words_octets = octets
+            self.words_order = (width, endian)
+        return wordview.WordView(octets[lo:hi], width, endian)
+
+    def stats(self):
+        ''' The (cached) ArtifactStats of the octets '''
+        if self.octet_stats is None:
+            self.octet_stats = artifact_stats.ArtifactStats(self.iter_chunks())
+        return self.octet_stats
 
     def bits(self, lo=None, width=None, hi=None):
-        ''' Get all bits as bitstring '''
+        ''' Get all bits as a BitString '''
         if lo is None:
             lo = 0
         if hi is None and width is not None:
             hi = lo + width
         if hi is None:
             hi = len(self) << 3
-        assert lo & 7 == 0
-        assert hi & 7 == 0
+        first = lo >> 3
+        last = (hi + 7) >> 3
         retval = []
         yet = 0
         for chunk in self.iter_chunks():
-            cbits = len(chunk) * 8
-            if yet + cbits < lo:
-                yet += cbits
-                continue
-            for i in chunk:
-                if yet + 8 < lo:
-                    yet += 8
-                    continue
-                retval.append(bin(256 | i)[-8:])
-                yet += 8
-                if yet >= hi:
-                    break
-            if yet >= hi:
+            if yet >= last:
                 break
-        return "".join(retval)[lo & 7:hi - (lo & ~7)]
+            if yet + len(chunk) > first:
+                retval.append(chunk[max(0, first - yet):last - yet])
+            yet += len(chunk)
+        return bitstring.BitString(b''.join(retval), lo & 7, (lo & 7) + hi - lo)
 
     def writetofile(self, file):
         ''' write artifact to a file '''
@@ -210,50 +415,43 @@ class Artifact(result_page.ResultPage):
     def define_rec(self, rec):
         ''' Define a record '''
         assert isinstance(rec, Record)
-        if rec.key in self._keys:
-            print("Duplicate key:", rec.key)
-            assert rec.key not in self._keys
-        if len(self._keys) == 0:
-            self._key_len = len(rec.key)
-            self._key_min = list(rec.key)
-            self._key_max = list(rec.key)
-        else:
-            if self._key_len != len(rec.key):
-                print(
-                    self,
-                    "Records have different key lengths:",
-                    self._key_len,
-                    len(rec.key),
-                    rec.key
-                )
-                assert self._key_len == len(rec.key)
-            for i in range(self._key_len):
-                self._key_min[i] = min(self._key_min[i], rec.key[i])
-                self._key_max[i] = max(self._key_min[i], rec.key[i])
-        if unread == rec.frag:
+        self._records.define(rec)
+        if self._records.unread[-1]:
             rec.undefined = True
-        self._keys[rec.key] = rec
-        self._reclens[len(rec)] = self._reclens.get(len(rec), 0) + 1
         rec.artifact = self
         return rec
 
+    def define_recs(self, geometry, lo=0):
+        '''
+           Define records from an iterable of (key, length), laid
+           out back to back from `lo`, without making Record objects
+        '''
+        keys = []
+        los = array.array('q')
+        his = array.array('q')
+        end = len(self)
+        for key, length in geometry:
+            keys.append(key)
+            los.append(lo)
+            his.append(max(lo, min(lo + length, end)))
+            lo += length
+        self._records.define_bulk(keys, los, his, self[:end])
+
     def num_rec(self):
         ''' Get number of records '''
-        return len(self._keys)
+        return len(self._records)
 
     def has_rec(self, key):
         ''' Get a Record (or None) '''
-        if key not in self._keys:
-            return None
-        return self._keys[key]
+        return self._records.get(key)
 
     def get_rec(self, key):
         ''' Get a Record '''
-        return self._keys[key]
+        return self._records[key]
 
     def iter_rec(self):
         ''' Iterate Records '''
-        yield from self._keys.values()
+        yield from self._records
 
     def set_digest(self, digest=None):
         ''' Calculate the SHA256 digest '''
@@ -412,23 +610,29 @@ class Artifact(result_page.ResultPage):
     def create(self, octets=None, start=None, stop=None, records=None, **kwargs):
         ''' Return a new or old artifact for some octets '''
         that = None
+        this = None
+        key = None
         if records:
             assert octets is None
             that = ArtifactFragmented(self.top, records, **kwargs)
             digest = that.digest
-        elif isinstance(octets, memoryview):
-            digest = hashlib.sha256(octets.tobytes()).hexdigest()
-        elif octets:
-            digest = hashlib.sha256(octets).hexdigest()
         else:
-            assert stop > start
-            assert stop <= len(self)
-            if not start and stop == len(self):
-                return self
-            octets = self[start:stop]
-            digest = hashlib.sha256(octets).hexdigest()
+            if not isinstance(octets, memoryview) and not octets:
+                assert stop > start
+                assert stop <= len(self)
+                if not start and stop == len(self):
+                    return self
+                octets = self[start:stop]
+            key, this = self.top.find_prehashed(octets)
+            if this:
+                digest = this.digest
+            else:
+                digest = digest_of(octets)
         assert digest[:9] != "1db831043"
-        this = self.top.hashes.get(digest)
+        if not this:
+            this = self.top.hashes.get(digest)
+            if key and isinstance(this, ArtifactStream):
+                self.top.add_prehashed(key, this)
         if not this:
             if that:
                 this = that
@@ -437,6 +641,8 @@ class Artifact(result_page.ResultPage):
                 this.set_digest(digest)
             this.type_case = self.type_case
             self.top.adopt(this)
+            if key and not that:
+                self.top.add_prehashed(key, this)
             this.add_parent(self)
         elif this != self:
             this.add_parent(self)
@@ -445,6 +651,8 @@ class Artifact(result_page.ResultPage):
         else:
             self.layout.append((0, len(self), this))
         this.byte_order = self.byte_order
+        if this.media_type is None:
+            this.media_type = self.media_type
         return this
 
     def summary(
@@ -593,11 +801,12 @@ class Artifact(result_page.ResultPage):
         file.write("<H3>Default Hex Dump</H3>\n")
         file.write("<pre>\n")
 
-        if len(self._keys) > max_lines and len(this) > max_lines * line_length:
+        records = self._records
+        if len(records) > max_lines and len(this) > max_lines * line_length:
             # We have records, dump them individually
             # reduce line-length to longest record
 
-            widest_record = max(len(x) for x in self._keys.values())
+            widest_record = max(map(operator.sub, records.hi, records.lo))
             line_length = min(line_length, widest_record)
 
             tmp = ov.OctetView(this, line_length=line_length)
@@ -605,8 +814,8 @@ class Artifact(result_page.ResultPage):
             if widest_record > line_length:
                 file.write("Dumping the first 0x%x bytes of each record\n" % line_length)
 
-            for rec in sorted(self._keys.values())[:max_lines]:
-                ov.Octets(tmp, lo = rec.lo, hi=rec.hi, line_length=line_length, maxlines=1).insert()
+            for lo, hi in sorted(zip(records.lo, records.hi))[:max_lines]:
+                ov.Octets(tmp, lo=lo, hi=hi, line_length=line_length, maxlines=1).insert()
         else:
             # unstructured
             tmp = ov.OctetView(this, line_length=line_length)
@@ -646,7 +855,7 @@ class ArtifactStream(Artifact):
         yield self.bdx
 
     def bits(self, lo=None, width=None, hi=None):
-        ''' Get a slice as a bitstring '''
+        ''' Get a slice as a BitString '''
         if lo is None:
             lo = 0
         if hi is None and width is None:
@@ -654,11 +863,8 @@ class ArtifactStream(Artifact):
         if hi is None:
             assert width is not None
             hi = lo + width
-        retval = []
         i = self.bdx[lo >> 3 : (hi + 7) >> 3]
-        for j in i:
-            retval.append(bin(256 | j)[-8:])
-        return "".join(retval)[lo & 7:hi - (lo & ~7)]
+        return bitstring.BitString(i, lo & 7, (lo & 7) + hi - lo)
 
     def bitint(self, lo, width=None, hi=None):
         ''' Get a slice as integer '''
@@ -687,15 +893,28 @@ class ArtifactStream(Artifact):
 class ArtifactFragmented(Artifact):
     '''
        Artifact consisting of fragments of other artifact(s)
+
+       The digest is calculated as the fragments are added.
+
+       Fragments which are extents of (read-only views of) immutable
+       buffers, typically the octets of the parent artifacts, are not
+       copied, other fragments are kept as immutable copies.  Nothing
+       is written until a contiguous view of more than one fragment
+       is asked for, at which point the backing file is written and
+       mapped.
     '''
 
+    # Slices across fragments up to this size are joined, rather
+    # than materializing the entire artifact
+    JOIN_LIMIT = 1 << 16
+
     def __init__(self, top, fragments=None, define_records=True):
         super().__init__()
         self._frags = []
-        self._keys = {}
         self._len = 0
-        self._backing = top.filename_for(top, temp=True)
-        self._file = open(self._backing.filename, "wb")
+        self._tmptop = top
+        self._backing = None
+        self._sha = hashlib.sha256()
         self._map = None
         self._binfile = False
         if fragments:
@@ -709,12 +928,30 @@ class ArtifactFragmented(Artifact):
         return self._len
 
     def __getitem__(self, idx):
+        if isinstance(idx, slice) and self._map is None:
+            start, stop, step = idx.indices(self._len)
+            if step == 1 and start >= stop:
+                return memoryview(b'')
+            if step == 1:
+                rec = self.fragment_at(start)
+                if stop <= rec.hi:
+                    return rec.frag[start - rec.lo:stop - rec.lo]
+                if stop - start <= self.JOIN_LIMIT:
+                    return self.join_fragments(start, stop)
+        elif isinstance(idx, int) and self._map is None:
+            if idx < 0:
+                idx += self._len
+            if not 0 <= idx < self._len:
+                raise IndexError("ArtifactFragmented index out of range")
+            rec = self.fragment_at(idx)
+            return rec.frag[idx - rec.lo]
         if isinstance(idx, (int, slice)):
-            return self._map.__getitem__(idx)
-        return self._keys[idx].frag
+            return self.materialize().__getitem__(idx)
+        return self._records[idx].frag
 
     def __iter__(self):
-        yield from self._map
+        for rec in self._frags:
+            yield from rec.frag
 
     def iter_chunks(self):
         for rec in self._frags:
@@ -722,8 +959,37 @@ class ArtifactFragmented(Artifact):
 
     def tobytes(self):
         ''' Return as bytes '''
+        if self._map is None:
+            return b''.join(self.iter_chunks())
         return bytes(self._map)
 
+    def fragment_index(self, offset):
+        ''' The index of the fragment containing an offset '''
+        return bisect.bisect_right(self._frags, offset, key=lambda x: x.lo) - 1
+
+    def fragment_at(self, offset):
+        ''' The fragment containing an offset '''
+        return self._frags[self.fragment_index(offset)]
+
+    def join_fragments(self, start, stop):
+        ''' Join the parts of the fragments from start to stop, as a view like other slices '''
+        parts = []
+        for rec in self._frags[self.fragment_index(start):]:
+            if rec.lo >= stop:
+                break
+            parts.append(rec.frag[max(start, rec.lo) - rec.lo:min(stop, rec.hi) - rec.lo])
+        return memoryview(b''.join(parts)).toreadonly()
+
+    @staticmethod
+    def is_extent(frag):
+        ''' Is this fragment a view of a buffer which cannot change ? '''
+        if not isinstance(frag, memoryview) or not frag.readonly:
+            return False
+        obj = frag.obj
+        if isinstance(obj, mmap.mmap):
+            return not obj.closed
+        return isinstance(obj, bytes)
+
     def add_fragment(self, frag, define_record=True):
         ''' Append a fragment '''
         if not isinstance(frag, Record):
@@ -731,19 +997,24 @@ class ArtifactFragmented(Artifact):
         else:
             frag = Record(self._len, frag=frag.frag, key=frag.key)
         assert frag.lo == self._len
+        if not self.is_extent(frag.frag):
+            # Not a stable extent, keep an immutable copy (bytes are not copied)
+            frag.frag = memoryview(bytes(frag.frag)).toreadonly()
         self._frags.append(frag)
         frag.artifact = self
         self._len += len(frag)
-        self._file.write(frag.frag)
+        self._sha.update(frag.frag)
         if define_record:
             self.define_rec(frag)
 
     def completed(self):
         ''' Build the tree and digest '''
         assert self._len > 0
-        self._file.flush()
-        self._file.close()
-        del self._file
+        self.set_digest(self._sha.hexdigest())
+        del self._sha
+
+    def map_backing(self):
+        ''' Map the backing file and re-slice the fragments from it '''
         with open(self._backing.filename, 'rb') as file:
             if self._len < (1<<16):
                 self._map = memoryview(file.read()).toreadonly()
@@ -756,19 +1027,36 @@ class ArtifactFragmented(Artifact):
                         #XXX: Python3.13 and forward use: trackfd=False,
                     )
                 ).toreadonly()
-        i = hashlib.sha256()
         off = 0
         for frag in self._frags:
             l = len(frag)
             frag.frag = self._map[off:off+l]
             off += l
-            i.update(frag.frag)
-        self.set_digest(i.hexdigest())
+
+    def materialize(self):
+        ''' Return the octets as a contiguous view, writing the backing file if need be '''
+        if self._map is None:
+            if self._backing is None:
+                self._backing = self._tmptop.filename_for(self._tmptop, temp=True)
+            with open(self._backing.filename, "wb") as file:
+                self.writetofile(file)
+            self.map_backing()
+        return self._map
+
+    def backing_filename(self):
+        ''' The backing file, written if need be '''
+        self.materialize()
+        return self._backing.filename
 
     def adopted(self):
         bn = self.top.filename_for(self, suf=".back")
-        os.rename(self._backing.filename, bn.filename)
+        if self._backing is not None:
+            os.rename(self._backing.filename, bn.filename)
         self._backing = bn
 
     def writetofile(self, file):
-        file.write(self._map)
+        if self._map is None:
+            for rec in self._frags:
+                file.write(rec.frag)
+        else:
+            file.write(self._map)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+   Octet statistics of artifacts
+   -----------------------------
+
+   Many examiners look at every octet of every artifact, only to
+   reject it, because it is filled with a single value, has too
+   many octets with bad parity, or too few zero octets and so on.
+
+   `Artifact.stats()` computes an `ArtifactStats` once, with C-speed
+   primitives, and all examiners share it:
+
+       stats = this.stats()
+       if stats.uniform is not None:
+           ...
+
+   The statistics are of the octets in storage order, not byte_order.
+   They are computed in pieces of CHUNK octets, so the artifact is
+   never copied as a whole.
+'''
+
+import re
+import math
+import collections
+
+PARITY = bytes(bin(x).count('1') & 1 for x in range(256))
+
+ZERO_RUNS = re.compile(b'\x00+')
+
+# Octets looked at in one go, bounds the memory used for copies
+CHUNK = 1 << 16
+
+def iter_pieces(octets):
+    ''' `octets`, bytes-like or an iterable of such, in pieces of CHUNK '''
+    try:
+        chunks = [memoryview(octets)]
+    except TypeError:
+        chunks = octets
+    for chunk in chunks:
+        view = memoryview(chunk).cast('B')
+        for i in range(0, len(view), CHUNK):
+            yield bytes(view[i:i + CHUNK])
+
+class ArtifactStats():
+    ''' Statistics of the octets of an artifact '''
+
+    def __init__(self, octets):
+        self.length = 0
+        self.histogram = [0] * 256
+        self.zero_runs = 0
+        self.longest_zero_run = 0
+
+        # The value all octets have, if they all have the same
+        self.uniform = None
+
+        counter = collections.Counter()
+        run = 0			# Zero run reaching the end of the last piece
+        for piece in iter_pieces(octets):
+            if not self.length:
+                self.uniform = piece[0]
+            self.length += len(piece)
+            if self.uniform is not None and piece.count(self.uniform) == len(piece):
+                self.histogram[self.uniform] += len(piece)
+                zeros = self.uniform == 0
+            else:
+                self.uniform = None
+                counter.update(piece)
+                zeros = 0 in piece
+            carry = run
+            run = 0
+            if not zeros:
+                continue
+            for match in ZERO_RUNS.finditer(piece):
+                length = match.end() - match.start()
+                if match.start() == 0 and carry:
+                    length += carry
+                else:
+                    self.zero_runs += 1
+                if match.end() == len(piece):
+                    run = length
+                self.longest_zero_run = max(self.longest_zero_run, length)
+        for i, j in counter.items():
+            self.histogram[i] += j
+
+        # [even, odd] parity octets
+        odd = sum(j for i, j in enumerate(self.histogram) if PARITY[i])
+        self.parities = [self.length - odd, odd]
+
+    def __repr__(self):
+        return "<ArtifactStats 0x%x %d values %.2f bits>" % (
+            self.length, len(self.values()), self.entropy()
+        )
+
+    def values(self):
+        ''' The octet values present '''
+        return [i for i, j in enumerate(self.histogram) if j]
+
+    def count(self, values):
+        ''' How many octets have one of the values '''
+        return sum(self.histogram[i] for i in values)
+
+    def entropy(self):
+        ''' Shannon entropy in bits per octet '''
+        if not self.length:
+            return 0.0
+        retval = 0.0
+        for i in self.histogram:
+            if i:
+                p = i / self.length
+                retval -= p * math.log2(p)
+        return retval
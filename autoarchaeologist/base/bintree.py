@@ -5,7 +5,7 @@
 # See LICENSE file for full text of license
 
 '''
-This class implements a basic recursive split-in-the-middle-interval-tree
+This class implements an interval-tree, sorted by width and address
 
 An interval-tree is a tree of intervals (duh!) which is useful here
 for keeping track of the bits we have taken apart.
@@ -14,20 +14,63 @@ Leafs must have numerical .lo and .hi attributes.
 
 Instantiating the tree you must provide the valid [lo...hi] interval.
 
-There is also an optional parameter to limit how narrow ranges we
-create subtrees for.  If it ever needs changing, we should probably
-change the algorithm to split trees based on actual number of nodes,
-rather than the interval they cover, but for now it seems to work
-pretty ok.
+The leaves are kept in rows by their width, rounded up to a power
+of two, and each row is a plain list in order of .lo.  A leaf can
+only overlap a query if it starts less than the width of its row
+below the query, so .find() bisects each row for the leaves which
+start in that window, and looks at little else than the k leaves
+it finds, no matter how densely they are packed.
+
+Leaves usually come in order of address, and are simply appended
+to their row.  Leaves which come late are set aside, and sorted in
+when the row is next looked at:  A few are inserted one by one,
+many are sorted in with a single sort.
+
+Iteration collects the rows, each in order of .lo, and sorts them
+in order of .lo and narrow before wider, which takes only a little
+more than linear time on such input.
+The tree keeps that list, until the next leaf is inserted.
+An iteration, and so .gaps(), runs over the list it started with,
+leaves inserted meanwhile, for instance to fill the gaps, are not
+seen until the next iteration.
+
+.find() returns the leaves in the same order as iteration, not in
+the order they were inserted.
+
+Run this file to test the tree, or with "-b" to benchmark it
+against the previous implementation, which split the address
+range down to a fixed width, whatever the number of leaves.
 '''
 
+import bisect
+import collections
+import heapq
+import itertools
+import operator
+import random
+import sys
+import time
+
+def leaf_order(leaf):
+    ''' Sort-key: order of .lo, narrow before wider '''
+    return (leaf.lo, leaf.hi)
+
+LO = operator.attrgetter("lo")
+HI = operator.attrgetter("hi")
+
 class BinTreeLeaf():
     '''
     Base-class for the leaves of the tree
     -------------------------------------
 
     You will be creating a LOT of these, so keep them cheap.
+
+    Subclasses which declare __slots__ all the way up have no
+    instance dict.
     '''
+
+    __slots__ = ("lo", "hi")
+
     def __init__(self, lo: int, hi: int):
         assert lo < hi
         self.lo = lo
@@ -62,44 +105,73 @@ class BinTreeLeaf():
     def dot_edges(self, _dot, _src=None):
         ''' ... '''
 
-class BinTreeBranch():
-
-    '''
-    Root&branch class of the tree
-    -----------------------------
-    '''
+class _Row():
+    ''' The leaves narrower than .reach, in order of .lo '''
+
+    __slots__ = ("reach", "los", "leaves", "late")
+
+    # Tuning: Insert up to this many late leaves one by one
+    LATE_LIMIT = 32
+
+    def __init__(self, reach):
+        self.reach = reach
+        self.los = []		# .lo of .leaves
+        self.leaves = []
+        self.late = []		# Out of order, in order of insertion
+
+    def settle(self):
+        ''' Sort in the late leaves '''
+        late = self.late
+        self.late = []
+        if len(late) <= self.LATE_LIMIT:
+            for leaf in late:
+                i = bisect.bisect_right(self.los, leaf.lo)
+                self.los.insert(i, leaf.lo)
+                self.leaves.insert(i, leaf)
+        else:
+            self.leaves += late
+            self.leaves.sort(key=LO)
+            self.los = list(map(LO, self.leaves))
 
-    # Tuning: Do not create branches smaller than this.
-    LOWER_LIMIT = 1<<16
+class BinTree():
+    ''' The root of the tree '''
 
-    def __init__(self, lo, hi):
+    def __init__(self, lo, hi, leaf=None):
         self.lo = lo
-        self.mid = (lo + hi) // 2
         self.hi = hi
-        self.less = None
-        self.more = None
-        self.cuts = []
-        self.isbranch = (hi - lo) > self.LOWER_LIMIT
+        self.rows = {}		# .bit_length() of width -> _Row
+        self.adrwidth = len("%x" % self.hi)
+        self.adrfmt = "%%0%dx" % self.adrwidth
+        self.separators = []
+        self.separators_width = 0
+        self.todo = collections.deque()
+        self.pending = set()
+        self.starts = None
+        self.leaf_class = leaf
+        self.ordered = None
 
     def __repr__(self):
-        return "<Branch 0x%x-0x%x-0x%x>" % (self.lo, self.mid, self.hi)
+        return "<Tree 0x%x-0x%x>" % (self.lo, self.hi)
 
     def insert(self, leaf):
         ''' You guessed it... '''
         assert isinstance(leaf, BinTreeLeaf)
-        assert leaf.lo < leaf.hi
-        if not self.isbranch:
-            self.cuts.append(leaf)
-            return leaf
-        if leaf.hi <= self.mid:
-            if self.less is None:
-                self.less = BinTreeBranch(self.lo, self.mid)
-            return self.less.insert(leaf)
-        if leaf.lo >= self.mid:
-            if self.more is None:
-                self.more = BinTreeBranch(self.mid, self.hi)
-            return self.more.insert(leaf)
-        self.cuts.append(leaf)
+        self.ordered = None
+        lo = leaf.lo
+        if self.starts is not None:
+            self.starts.setdefault(lo, leaf)
+        bits = (leaf.hi - lo).bit_length()
+        assert bits
+        row = self.rows.get(bits)
+        if row is None:
+            row = _Row(1 << bits)
+            self.rows[bits] = row
+        los = row.los
+        if los and lo < los[-1]:
+            row.late.append(leaf)
+        else:
+            los.append(lo)
+            row.leaves.append(leaf)
         return leaf
 
     def find(self, lo=None, hi=None):
@@ -109,48 +181,36 @@ class BinTreeBranch():
             hi = lo + 1
         if lo is None:
             lo = hi - 1
-        if lo <= self.mid and self.less:
-            yield from self.less.find(lo, hi)
-        for i in self.cuts:
-            if i.lo < hi and lo < i.hi:
-                yield i
-        if hi >= self.mid and self.more:
-            yield from self.more.find(lo, hi)
+        found = []
+        for row in self.rows.values():
+            if row.late:
+                row.settle()
+            los = row.los
+            i = bisect.bisect_right(los, lo - row.reach)
+            j = bisect.bisect_left(los, hi, i)
+            if i < j:
+                found += [x for x in row.leaves[i:j] if lo < x.hi]
+        if len(found) > 1:
+            found.sort(key=leaf_order)
+        yield from found
+
+    def leaves(self):
+        ''' All the leaves, in order '''
+        lst = []
+        for row in self.rows.values():
+            if row.late:
+                row.settle()
+            lst += row.leaves
+        # Two stable sorts on plain ints beat one on (.lo, .hi) tuples
+        lst.sort(key=HI)
+        lst.sort(key=LO)
+        return lst
 
     def __iter__(self):
         ''' Iterate in order of .lo and narrow before wider. '''
-        stk = [self]
-        lst = []
-
-        while stk:
-            cur = stk.pop()
-            while lst and lst[0].lo < cur.lo:
-                yield lst.pop(0)
-            lst.extend(cur.cuts)
-            lst.sort(key=lambda i: (i.lo, i.hi))
-            if cur.more:
-                stk.append(cur.more)
-            if cur.less:
-                stk.append(cur.less)
-            else:
-                while lst and lst[0].lo < cur.mid:
-                    yield lst.pop(0)
-        yield from lst
-
-class BinTree(BinTreeBranch):
-    ''' The root of the tree '''
-
-    def __init__(self, *args, leaf=None, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.adrwidth = len("%x" % self.hi)
-        self.adrfmt = "%%0%dx" % self.adrwidth
-        self.separators = []
-        self.separators_width = 0
-        self.todo = []
-        self.leaf_class = leaf
-
-    def __repr__(self):
-        return "<Tree 0x%x-0x%x-0x%x>" % (self.lo, self.mid, self.hi)
+        if self.ordered is None:
+            self.ordered = self.leaves()
+        yield from self.ordered
 
     def gaps(self):
         ''' Yield all the gaps in the tree '''
@@ -229,21 +289,55 @@ class BinTree(BinTreeBranch):
         if repeat_line > 0:
             yield " " * len(pfx) + "[…0x%x…]" % repeat_line
 
+    def covers(self, adr):
+        ''' Is there a leaf containing adr ? '''
+        if self.starts is None:
+            # Index of .lo, built in one pass, then kept up by .insert()
+            self.starts = {}
+            for leaf in self:
+                self.starts.setdefault(leaf.lo, leaf)
+        if adr in self.starts:
+            return True
+        for _i in self.find(adr, adr + 1):
+            return True
+        return False
+
+    def containing(self, adrs):
+        '''
+           The leaves containing each of the addresses, in order of .lo,
+           found in a single sweep over the tree.
+        '''
+        retval = {}
+        active = []
+        seq = itertools.count()
+        leaves = iter(self)
+        nxt = next(leaves, None)
+        for adr in sorted(set(adrs)):
+            while nxt is not None and nxt.lo <= adr:
+                heapq.heappush(active, (nxt.hi, next(seq), nxt))
+                nxt = next(leaves, None)
+            while active and active[0][0] <= adr:
+                heapq.heappop(active)
+            retval[adr] = sorted((x[2] for x in active), key=leaf_order)
+        return retval
+
     def points_to(self, lo, cls):
         ''' Used by pointer-like leaves to propagate without stack overflow '''
 
-        for _i in self.find(lo, lo + 1):
+        if lo in self.pending or self.covers(lo):
             return
-        first = len(self.todo) == 0
+        self.pending.add(lo)
+        first = not self.todo
         self.todo.append((lo, cls))
         if not first:
             return
         while self.todo:
             # NB: Must stay on todo to prevent endless recursion
             lo, cls = self.todo[0]
-            if not list(self.find(lo, lo + 1)):
+            if not self.covers(lo):
                 cls(self, lo).insert()
-            self.todo.pop(0)
+            self.todo.popleft()
+            self.pending.discard(lo)
 
 def test_tree():
     ''' Minimal test cases '''
@@ -297,8 +391,173 @@ def test_tree():
         assert j.hi > 0x200
     print("  .find() OK")
 
+    # Leaves of many widths, compared against brute force
+    rnd = random.Random(42)
+    ash = BinTree(0, 0x10000)
+    lst = []
+    for _i in range(5000):
+        lo = rnd.randrange(0x10000)
+        hi = min(0x10000, lo + rnd.choice((1, 2, 8, 0x40, 0x1000)))
+        lst.append(ash.insert(BinTreeLeaf(lo, hi)))
+        if rnd.randrange(10) == 0:
+            lo = rnd.randrange(0x10000)
+            hi = lo + rnd.randrange(1, 0x100)
+            assert list(ash.find(lo, hi)) == sorted(
+                (x for x in lst if x.lo < hi and lo < x.hi),
+                key=leaf_order
+            )
+    assert [id(x) for x in ash] == [id(x) for x in sorted(lst, key=leaf_order)]
+    print("  interleaved .find() OK")
+
+    # Late leaves, a few and many at a time
+    elm = BinTree(0, 0x10000)
+    lst = []
+    for _i in range(20):
+        for _j in range(rnd.choice((1, 100, 1000))):
+            lo = rnd.randrange(0x10000)
+            hi = min(0x10000, lo + rnd.choice((1, 2, 8, 0x40, 0x1000, 0x8000)))
+            lst.append(elm.insert(BinTreeLeaf(lo, hi)))
+        for _j in range(20):
+            lo = rnd.randrange(0x10000)
+            hi = lo + rnd.randrange(1, 0x100)
+            assert list(elm.find(lo, hi)) == sorted(
+                (x for x in lst if x.lo < hi and lo < x.hi),
+                key=leaf_order
+            )
+    assert [id(x) for x in elm] == [id(x) for x in sorted(lst, key=leaf_order)]
+    print("  late leaves OK")
+
+    # Filling the gaps while iterating over them
+    fir = BinTree(0, 0x100)
+    fir.insert(BinTreeLeaf(0x10, 0x20))
+    fir.insert(BinTreeLeaf(0x80, 0x90))
+    for lo, hi in fir.gaps():
+        fir.insert(BinTreeLeaf(lo, hi))
+    assert not list(fir.gaps())
+    assert len(list(fir)) == 5
+    print("  filling .gaps() OK")
+
     print("Happy")
 
+class _RangeSplitBranch():
+    '''
+    The previous implementation, for benchmark(), which split
+    the address range down to LOWER_LIMIT, whatever the number
+    of leaves.
+    '''
+
+    LOWER_LIMIT = 1<<16
+
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.mid = (lo + hi) // 2
+        self.hi = hi
+        self.less = None
+        self.more = None
+        self.cuts = []
+        self.isbranch = (hi - lo) > self.LOWER_LIMIT
+
+    def insert(self, leaf):
+        ''' ... '''
+        if not self.isbranch:
+            self.cuts.append(leaf)
+            return leaf
+        if leaf.hi <= self.mid:
+            if self.less is None:
+                self.less = _RangeSplitBranch(self.lo, self.mid)
+            return self.less.insert(leaf)
+        if leaf.lo >= self.mid:
+            if self.more is None:
+                self.more = _RangeSplitBranch(self.mid, self.hi)
+            return self.more.insert(leaf)
+        self.cuts.append(leaf)
+        return leaf
+
+    def find(self, lo, hi):
+        ''' ... '''
+        if lo <= self.mid and self.less:
+            yield from self.less.find(lo, hi)
+        for i in self.cuts:
+            if i.lo < hi and lo < i.hi:
+                yield i
+        if hi >= self.mid and self.more:
+            yield from self.more.find(lo, hi)
+
+    def __iter__(self):
+        stk = [self]
+        lst = []
+
+        while stk:
+            cur = stk.pop()
+            while lst and lst[0].lo < cur.lo:
+                yield lst.pop(0)
+            lst.extend(cur.cuts)
+            lst.sort(key=leaf_order)
+            if cur.more:
+                stk.append(cur.more)
+            if cur.less:
+                stk.append(cur.less)
+            else:
+                while lst and lst[0].lo < cur.mid:
+                    yield lst.pop(0)
+        yield from lst
+
+def benchmark(sizes=(10**3, 10**4, 10**5, 10**6, 10**7), queries=10**4):
+    '''
+       Time insertion, in address order and in random order,
+       point-queries and iteration of `sizes` leaves, mostly
+       small and some wide, as an OctetView would have them.
+
+       The first query after insertion in random order includes
+       sorting in the late leaves.
+    '''
+
+    print("%9s %-10s %10s %10s %10s %10s" % (
+        "leaves", "tree", "ordered", "random", "find", "iterate"
+    ))
+    for size in sizes:
+        rnd = random.Random(size)
+        span = size * 8
+        geometry = []
+        for _i in range(size):
+            lo = rnd.randrange(span)
+            width = rnd.choice((1, 2, 4, 8, 16, 16, 32, 512))
+            geometry.append((lo, min(span, lo + width)))
+        points = [rnd.randrange(span) for _i in range(queries)]
+        for cls in (_RangeSplitBranch, BinTree):
+            times = []
+            leaves = sorted(BinTreeLeaf(lo, hi) for lo, hi in geometry)
+            tree = cls(0, span)
+            t0 = time.perf_counter()
+            for leaf in leaves:
+                tree.insert(leaf)
+            times.append(time.perf_counter() - t0)
+            del tree
+            rnd.shuffle(leaves)
+            tree = cls(0, span)
+            t0 = time.perf_counter()
+            for leaf in leaves:
+                tree.insert(leaf)
+            times.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            for adr in points:
+                for _leaf in tree.find(adr, adr + 1):
+                    pass
+            times.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            for _leaf in tree:
+                pass
+            times.append(time.perf_counter() - t0)
+            print(
+                "%9d %-10s" % (size, cls.__name__.strip("_")[:10]),
+                " ".join("%10.3f" % x for x in times),
+                flush=True,
+            )
+            del tree, leaves
+
 if __name__ == "__main__":
 
-    test_tree()
+    if sys.argv[1:] == ["-b"]:
+        benchmark()
+    else:
+        test_tree()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+   Packed bit-strings
+   ------------------
+
+   A `BitString` is a sequence of bits, MSB first, kept packed in
+   octets, rather than as a python string of '0' and '1' characters.
+
+   It behaves like such a string where the bit-level code needs it
+   to: Indexing and iteration give '0' and '1' characters, `str()`
+   renders it, `find()` and `in` take either `BitString` or '0'/'1'
+   strings as patterns, and it compares equal to the string it
+   renders as.
+
+   Slicing is at arbitrary bit offsets and does not copy, and the
+   value of a slice is extracted with `int()`:
+
+       val = int(bits[lo:lo+32])
+
+   NB: not `int(bits[lo:lo+32], 2)`, python only accepts strings
+   with an explicit base.
+'''
+
+class BitString():
+    ''' Packed bits, a view of `octets` from bit `lo` to bit `hi` '''
+
+    # Bits rendered at a time, when searching for short patterns
+    WINDOW = 1 << 12
+
+    def __init__(self, octets=b'', lo=0, hi=None):
+        if not isinstance(octets, bytes):
+            octets = bytes(octets)
+        if hi is None:
+            hi = len(octets) << 3
+        assert 0 <= lo <= hi <= len(octets) << 3
+        self.octets = octets
+        self.lo = lo
+        self.hi = hi
+
+    @classmethod
+    def from_int(cls, val, width):
+        ''' From the `width` least significant bits of an integer '''
+        pad = -width & 7
+        val &= (1 << width) - 1
+        return cls((val << pad).to_bytes((width + pad) >> 3, 'big'), 0, width)
+
+    @classmethod
+    def from_str(cls, txt):
+        ''' From a string of '0' and '1' '''
+        if not txt:
+            return cls()
+        return cls.from_int(int(txt, 2), len(txt))
+
+    @classmethod
+    def make(cls, bits):
+        ''' Make a BitString out of a BitString or a string '''
+        if isinstance(bits, cls):
+            return bits
+        return cls.from_str(bits)
+
+    def __len__(self):
+        return self.hi - self.lo
+
+    def __int__(self):
+        if self.hi == self.lo:
+            return 0
+        val = int.from_bytes(self.octets[self.lo >> 3:(self.hi + 7) >> 3], 'big')
+        val >>= -self.hi & 7
+        return val & ((1 << (self.hi - self.lo)) - 1)
+
+    def __str__(self):
+        if self.hi == self.lo:
+            return ""
+        return format(int(self), "0%db" % (self.hi - self.lo))
+
+    def __repr__(self):
+        return "<BitString 0x%x bits>" % len(self)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1:
+                return BitString.from_str(str(self)[idx])
+            stop = max(start, stop)
+            return BitString(self.octets, self.lo + start, self.lo + stop)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("BitString index out of range")
+        idx += self.lo
+        return "01"[(self.octets[idx >> 3] >> (7 - (idx & 7))) & 1]
+
+    def __iter__(self):
+        for i in range(0, len(self), self.WINDOW):
+            yield from str(self[i:i + self.WINDOW])
+
+    def __eq__(self, other):
+        if isinstance(other, BitString):
+            return len(self) == len(other) and int(self) == int(other)
+        if isinstance(other, str):
+            return str(self) == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __add__(self, other):
+        if isinstance(other, BitString):
+            return BitString.from_int(
+                (int(self) << len(other)) | int(other),
+                len(self) + len(other)
+            )
+        if isinstance(other, str):
+            return str(self) + other
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, str):
+            return other + str(self)
+        return NotImplemented
+
+    def __contains__(self, pattern):
+        return self.find(pattern) >= 0
+
+    def find(self, pattern, start=0, end=None):
+        ''' Like str.find(), the pattern can be a BitString or a string '''
+        pattern = BitString.make(pattern)
+        length = len(self)
+        start, end, _step = slice(start, end).indices(length)
+        width = len(pattern)
+        if end - start < width:
+            return -1
+        if width < 15:
+            return self.find_short(str(pattern), start, end)
+        return self.find_long(pattern, start, end)
+
+    def find_short(self, pattern, start, end):
+        ''' Search in rendered windows, growing as we go '''
+        window = self.WINDOW
+        while start < end:
+            stop = min(end, start + window + len(pattern) - 1)
+            i = str(self[start:stop]).find(pattern)
+            if i >= 0:
+                return start + i
+            if stop == end:
+                break
+            start += window
+            window = min(window << 1, self.WINDOW << 6)
+        return -1
+
+    def find_long(self, pattern, start, end):
+        '''
+           Search for the full octets of the pattern with bytes.find()
+           for each of the eight possible alignments, and check the
+           bits before and after in the candidates.
+        '''
+        width = len(pattern)
+        val = int(pattern)
+        lo = self.lo + start
+        hi = self.lo + end - width	# Last possible position
+        best = -1
+        for align in range(8):
+            head = -align & 7
+            core = (width - head) >> 3
+            tail = width - head - (core << 3)
+            needle = ((val >> tail) & ((1 << (core << 3)) - 1)).to_bytes(core, 'big')
+            pos = (lo + head + 7) >> 3
+            limit = (hi + head) >> 3
+            if best >= 0:
+                limit = min(limit, (best + head) >> 3)
+            while pos <= limit:
+                pos = self.octets.find(needle, pos, limit + core)
+                if pos < 0:
+                    break
+                adr = (pos << 3) - head
+                if adr >= lo and adr <= hi and int(BitString(self.octets, adr, adr + width)) == val:
+                    if best < 0 or adr < best:
+                        best = adr
+                    break
+                pos += 1
+        if best < 0:
+            return -1
+        return best - self.lo
@@ -7,10 +7,15 @@
 '''
    Operating on artifacts in bit-alignment
    ---------------------------------------
+
+   The bits are kept in a `bitstring.BitString`, strings of '0'
+   and '1' are converted.
 '''
 
 from . import bintree
+from . import bitstring
 from . import datastruct
+from . import wordview
 from . import octetview as ov
 
 class_cache = {}
@@ -39,6 +44,8 @@ class OvBits(ov.Octets):
 
 class Bits(bintree.BinTreeLeaf):
 
+    __slots__ = ("tree", "__dict__")
+
     rendered = None
 
     def __init__(self, tree, lo, width=None, hi=None, name=None):
@@ -76,7 +83,7 @@ class Bits(bintree.BinTreeLeaf):
     def render(self):
         ''' Render as bits '''
         if self.rendered is None:
-            yield self.tree.bits[self.lo:self.hi]
+            yield str(self.tree.bits[self.lo:self.hi])
         else:
             yield self.rendered
 
@@ -86,9 +93,11 @@ class BitView(bintree.BinTree):
         if this and not bits:
             bits = this.bits()
         self.octets = octets
-        self.bits = bits
+        self.bits = bitstring.BitString.make(bits)
         self.type_case = type_case
         self.this = this
+        self.pointers = []
+        self.destinations = None
         assert self.bits
         super().__init__(
             lo=0,
@@ -96,9 +105,54 @@ class BitView(bintree.BinTree):
             leaf=Bits
         )
 
+    def insert(self, leaf):
+        self.destinations = None
+        return super().insert(leaf)
+
+    def add_pointer(self, ptr):
+        ''' Pointers are resolved in bulk before rendering '''
+        self.destinations = None
+        self.pointers.append(ptr)
+
     def prefix(self, lo, hi):
         return "*0x" + self.adrfmt % lo + "…" + self.adrfmt % hi
 
+    def resolve_pointers(self):
+        '''
+           Find the destinations of all the pointers in one sweep,
+           cache the good ones and report the bad ones in bulk.
+        '''
+        if self.destinations is not None:
+            return
+        self.destinations = self.containing(x.val for x in self.pointers)
+        bad = {}
+        for ptr in self.pointers:
+            if ptr.val in ptr.elide or ptr.val in ptr.NOWHERE:
+                continue
+            dst = self.destinations[ptr.val]
+            if not dst:
+                why = "dangling"
+            elif len(dst) > 1:
+                why = "ambiguous"
+            elif dst[0].lo != ptr.val:
+                why = "interior"
+            else:
+                ptr.cached_dst = dst[0]
+                continue
+            bad.setdefault(why, []).append(ptr)
+        for why, ptrs in sorted(bad.items()):
+            print(
+                self.this,
+                len(ptrs),
+                why,
+                "pointers, like",
+                ", ".join(x.describe() for x in ptrs[:4]),
+            )
+
+    def render(self, *args, **kwargs):
+        self.resolve_pointers()
+        yield from super().render(*args, **kwargs)
+
     def add_interpretation(self, title="BitView", more=False, **kwargs):
         ''' Render via UTF-8 file '''
         with self.this.add_utf8_interpretation(title, more=more) as file:
@@ -112,9 +166,11 @@ class Opaque(Bits):
 
 class Char(Bits):
 
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, *args, **kwargs):
         super().__init__(tree, lo, hi=lo+8, *args, **kwargs)
-        self.val = int(self.bits(), 2)
+        self.val = int(self.bits())
 
     def render(self):
         if 32 <= self.val <= 0x7e:
@@ -124,13 +180,15 @@ class Char(Bits):
 
 class Number(Bits):
 
+    __slots__ = ("val",)
+
     fmt = None
 
     fmts = ["0x%%0%dx" % ((x + 3) // 4) for x in range(129)]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.val = int(self.bits(), 2)
+        self.val = int(self.bits())
 
     def render(self):
         if self.fmt:
@@ -154,17 +212,51 @@ class Struct(datastruct.Struct, Bits):
             return Number(self.tree, offset, width=-width)
         return Bits(self.tree, offset, width=width)
 
+    def layout_octets(self, lo, hi):
+        if hi > len(self.tree.bits):
+            return None
+        return b''
+
+    def lazy_field(self, what, lo, width, val):
+        if not isinstance(what, int) or what >= 0 or val is None:
+            return super().lazy_field(what, lo, width, val)
+        # The value is already unpacked
+        obj = Number.__new__(Number)
+        Bits.__init__(obj, self.tree, lo, width=width)
+        obj.val = val
+        return obj
+
+    def bulk_values(self, what, lo, count, width, fmt):
+        if not isinstance(what, int) or what >= 0 or width > 64:
+            return None
+        bits = count * width
+        if lo + bits > len(self.tree.bits):
+            return None
+        pad = -bits & 7
+        octets = (int(self.tree.bits[lo:lo + bits]) << pad).to_bytes((bits + pad) >> 3, 'big')
+        vals = wordview.unpack(octets, width)
+        del vals[count:]
+        return vals
+
 def Array(count, what, **kwargs):
     return datastruct.Array(Struct, count, what, **kwargs)
 
 def Text(width, glyph_width=8, rstrip = False):
 
+    key = str(("Text", width, glyph_width, rstrip))
+    cls = class_cache.get(key)
+    if cls:
+        return cls
+
     class Text_Class(Bits):
         ''' Fixed width text String (convenient for Struct) '''
 
         WIDTH = width
+        FIXED_WIDTH = width * glyph_width
         RSTRIP = rstrip
         GLYPH_WIDTH = glyph_width
+        FACTORY = (Text, (width, glyph_width, rstrip))
+
         def __init__(self, *args, type_case=None, **kwargs):
             kwargs["width"] = self.WIDTH * self.GLYPH_WIDTH
             super().__init__(*args, **kwargs)
@@ -177,15 +269,18 @@ def Text(width, glyph_width=8, rstrip = False):
         def iter_glyphs(self):
             i = self.bits()
             for a in range(0, len(self), self.GLYPH_WIDTH):
-                yield int(i[a:a+self.GLYPH_WIDTH], 2)
+                yield int(i[a:a+self.GLYPH_WIDTH])
 
         def render(self):
             yield "»" + self.txt + "«"
 
+    class_cache[key] = Text_Class
     return Text_Class
 
 class Pointer(Bits):
 
+    __slots__ = ("val", "target", "elide", "cached_dst")
+
     TARGET = None
     WIDTH = None
     ELIDE = {}
@@ -201,56 +296,41 @@ class Pointer(Bits):
         if elide is None:
             elide = self.ELIDE
         super().__init__(bvtree, lo, width=width)
-        self.val = int(self.bits(), 2)
+        self.val = int(self.bits())
         self.target = target
         self.elide = elide
         self.cached_dst = None
+        bvtree.add_pointer(self)
         if self.target is not None:
             bvtree.points_to(self.val, self.target)
 
+    def hits(self):
+        ''' The leaves containing our destination '''
+        dests = self.tree.destinations
+        if dests is not None and self.val in dests:
+            return dests[self.val]
+        return list(self.tree.find(self.val, self.val+1))
+
     def dst(self):
         if self.cached_dst is not None:
             return self.cached_dst
-        i = list(self.tree.find(self.val, self.val+1))
-        if len(i) == 0:
+        i = self.hits()
+        if len(i) != 1 or i[0].lo != self.val:
             return None
-        if len(i) > 1:
-            dst = set()
-            for j in i:
-                t = j.__class__.__name__
-                if j.lo < self.val:
-                    t += "+0x%x" % (self.val - j.lo)
-                dst.add(t)
-            print(
-                self.tree.this,
-                "Pointer at",
-                hex(self.lo),
-                "points to",
-                hex(self.val),
-                "with",
-                len(i),
-                "destinations of class",
-                ",".join(list(dst)),
-            )
-            return None
-        dst = i[0]
-        if dst.lo != self.val:
-            print(
-                "Pointer at",
-                hex(self.lo),
-                "Points to",
-                hex(self.val),
-                "which is",
-                hex(self.val - dst.lo),
-                "into object at",
-                hex(dst.lo),
-                "which is class",
-                dst.__class__.__name__,
-            )
-            return None
-        self.cached_dst = dst
+        self.cached_dst = i[0]
         return self.cached_dst
 
+    def describe(self):
+        ''' Where we point, for diagnostics '''
+        i = self.hits()
+        txt = "0x%x→0x%x" % (self.lo, self.val)
+        if i:
+            txt += "(" + ",".join(
+                j.__class__.__name__ + ("+0x%x" % (self.val - j.lo) if j.lo < self.val else "")
+                for j in i
+            ) + ")"
+        return txt
+
     def render(self):
         if self.val in self.elide:
             return
@@ -280,9 +360,11 @@ class Pointer(Bits):
 
 def make_constant(width=32, value=0):
     class ClsConstant(Bits):
+        FACTORY = (Constant, (width, value))
+
         def __init__(self, bvtree, lo, width=width, value=value):
             super().__init__(bvtree, lo, width=width)
-            self.val = int(self.bits(), 2)
+            self.val = int(self.bits())
             if self.val != value:
                 print(bvtree.this,
                     "WARNING: bv.Constant at 0x%x is 0x%x instead of 0x%x" % (
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+    AutoArchaeologist Checkpoints
+    -----------------------------
+
+    With `Excavation(checkpoint_interval=N)` the state of the
+    excavation is saved in the "Checkpoint" subdirectory of the
+    cache_dir every N seconds during examination, and once more
+    when examination is complete.
+
+    If the program dies, `Excavation.resume_checkpoint()` reloads
+    the state, continues the examination where it left off, or
+    if it had already completed, lets the program go straight to
+    `produce_html()`.
+
+    The checkpoint is removed when `produce_html()` completes.
+
+    A checkpoint is only resumed by the same command line, with the
+    same examiners and the same source code, the way the findings
+    cache is keyed, otherwise it is discarded.  (The source is
+    compared module by module, so modules imported later in the
+    run which saved it are still compared.)
+
+    A checkpoint holds the pickled artifacts, with everything
+    hanging off them, the queue and the excavation-wide state.
+    The content of artifacts is described as a slice of a parent,
+    the plain file it was read from, or a backing file.  Backing
+    files and the files of interpretations are hard-linked (or
+    copied) into the checkpoint, because the originals in the
+    html_dir are removed when the program exits.
+
+    Checkpoints are only taken between artifacts, and not at all
+    while findings are being examined for parallel workers or the
+    findings cache.
+'''
+
+import os
+import sys
+import mmap
+import time
+import pickle
+import shutil
+import hashlib
+
+from . import artifact
+from . import findings
+from . import findings_cache
+
+# The excavation attributes saved in the checkpoint
+EXCAVATION = (
+    "children",
+    "queue",
+    "names",
+    "multivol",
+    "by_class",
+    "unique_counter",
+    "profiler",
+)
+
+def link_or_copy(src, dst):
+    ''' Hard-link if possible, copy otherwise '''
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+class Checkpoint():
+    ''' Save and restore the excavation state '''
+
+    def __init__(self, top, interval):
+        self.top = top
+        self.interval = float(interval)
+        self.path = os.path.join(
+            top.get_cache_subdir("Checkpoint"),
+            top.__class__.__name__ + "_" +
+            hashlib.sha256(os.path.abspath(top.html_dir).encode("utf8")).hexdigest()[:16],
+        )
+        self.last = time.time()
+        self.contents = {}
+        self.saved_identity = None
+
+    def identity(self, modules=None):
+        ''' The command line, the examiners and digests of the source '''
+        if modules is None:
+            modules = findings_cache.source_modules(self.top)
+        sources = {}
+        for name in modules:
+            source = findings_cache.source_of(name)
+            if source is not None:
+                source = hashlib.sha256(source).hexdigest()
+            sources[name] = source
+        return (
+            tuple(sys.argv[1:]),
+            tuple(ex.__module__ + "." + ex.__qualname__ for ex in self.top.examiners),
+            sources,
+        )
+
+    def due(self):
+        ''' Is it time for a checkpoint ? '''
+        return time.time() - self.last >= self.interval
+
+    def content(self, that, tmpdir):
+        ''' Describe the content of an artifact, link files into tmpdir '''
+        retval = self.contents.get(that.digest)
+        if retval is None:
+            retval = findings.slice_of_parent(that)
+        if retval is None and that.__dict__.get("plain_filename"):
+            retval = ("plain", that.plain_filename, len(that))
+        if retval is None:
+            retval = ("file", that.digest + ".back")
+        self.contents[that.digest] = retval
+        if retval[0] == "file":
+            link_or_copy(self.backing_file(that), os.path.join(tmpdir, retval[1]))
+        return retval
+
+    def backing_file(self, that):
+        ''' The `.back` file of an artifact, written if need be '''
+        if isinstance(that, artifact.ArtifactFragmented):
+            return that.backing_filename()
+        backing = self.top.backing_for(that)
+        if not os.path.exists(backing.filename):
+            with open(backing.filename, "wb") as file:
+                that.writetofile(file)
+        return backing.filename
+
+    def save(self, phase):
+        ''' Save a checkpoint '''
+        t0 = time.time()
+        tmpdir = self.path + ".tmp.%d" % os.getpid()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        os.makedirs(tmpdir)
+        stashed = []
+
+        def stash(filename):
+            name = "i%d" % len(stashed)
+            link_or_copy(filename, os.path.join(tmpdir, name))
+            stashed.append(name)
+            return name
+
+        try:
+            table = []
+            for that in self.top.hashes.values():
+                # NB: content first, it may write the backing file
+                content = self.content(that, tmpdir)
+                state = {
+                    x: y for x, y in that.__dict__.items()
+                    if not isinstance(y, (memoryview, mmap.mmap))
+                }
+                table.append((that, content, state))
+            state = {x: getattr(self.top, x) for x in EXCAVATION}
+            if self.saved_identity is None:
+                self.saved_identity = self.identity()
+            with open(os.path.join(tmpdir, "identity.pickle"), "wb") as file:
+                pickle.dump(self.saved_identity, file)
+            with open(os.path.join(tmpdir, "checkpoint.pickle"), "wb") as file:
+                findings.Pickler(file, self.top, stash=stash).dump((phase, state, table))
+        except Exception as err:
+            print("Checkpoint failed", err)
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            self.last = time.time()
+            return
+        old = self.path + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.isdir(self.path):
+            os.rename(self.path, old)
+        os.rename(tmpdir, self.path)
+        shutil.rmtree(old, ignore_errors=True)
+        self.last = time.time()
+        print(
+            "Checkpoint (%s) of %d artifacts in %.1f seconds" % (
+                phase, len(table), self.last - t0
+            )
+        )
+
+    def load(self):
+        ''' Load the checkpoint, return the phase or None '''
+        filename = os.path.join(self.path, "checkpoint.pickle")
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(os.path.join(self.path, "identity.pickle"), "rb") as file:
+                saved = pickle.load(file)
+            stale = saved != self.identity(saved[2])
+        except Exception:
+            stale = True
+        if stale:
+            print("Checkpoint is from another command line or source, discarded")
+            self.remove()
+            return None
+
+        def unstash(name):
+            # NB: The TempFile must be gone before we link the file
+            filename = self.top.filename_for(self.top, suf=".tmp", temp=True).filename
+            link_or_copy(os.path.join(self.path, name), filename)
+            return filename
+
+        with open(filename, "rb") as file:
+            loader = findings.Unpickler(file, self.top, unstash=unstash)
+            phase, state, table = loader.load()
+
+        for that, content, adict in table:
+            that.__dict__.update(adict)
+            that.checkpoint_content = content
+        for that, content, adict in table:
+            self.restore_content(that)
+            self.top.hashes[that.digest] = that
+        for rec in loader.records:
+            rec.frag = findings.content_of(rec.artifact)[rec.lo:rec.hi]
+        for key, val in state.items():
+            setattr(self.top, key, val)
+        print("Resumed checkpoint (%s) of %d artifacts" % (phase, len(table)))
+        return phase
+
+    def restore_content(self, that):
+        ''' Give an artifact its octets '''
+        content = that.__dict__.pop("checkpoint_content", None)
+        if content is None:
+            return
+        self.contents[that.digest] = content
+        if content[0] == "slice":
+            _kind, parent, lo, hi = content
+            self.restore_content(parent)
+            octets = findings.content_of(parent)[lo:hi]
+        elif content[0] == "plain":
+            _kind, filename, length = content
+            if os.stat(filename).st_size != length:
+                raise findings.FindingsError("File changed: " + filename)
+            octets = findings.map_file(filename)
+        else:
+            if isinstance(that, artifact.ArtifactFragmented):
+                filename = that._backing.filename
+            else:
+                filename = self.top.backing_for(that).filename
+            if not os.path.exists(filename):
+                link_or_copy(os.path.join(self.path, content[1]), filename)
+            octets = findings.map_file(filename)
+        if isinstance(that, artifact.ArtifactFragmented):
+            that._map = octets
+        else:
+            that.bdx = octets
+
+    def remove(self):
+        ''' Remove the checkpoint '''
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -5,8 +5,100 @@
 # See LICENSE file for full text of license
 
 '''
+   Composite data structures
+   -------------------------
+
+   The field specification of a `Struct` is compiled into a `Layout`
+   the first time a class uses it:  The leading fields whose width
+   is known in advance get fixed offsets, and the fields with a
+   PACKED `struct` format are decoded with a single `unpack_from()`.
+
+   A field class declares PACKED (octets) or FIXED_WIDTH (in the
+   units of the tree), if instances always have that width and
+   creating one has no side effects.  Subclasses which override
+   `__init__()` are not trusted to keep that promise.
+
+   Fields in a layout are only made into leaf objects when they are
+   asked for, by attribute access, `.fields`, rendering and so on.
+
+   Likewise an `Array` of such fields, if `bulk_values()` can decode
+   all the values at once, into an `array.array`, keeps them in
+   `.values` and makes the elements on demand.  Indexing and iteration
+   of a NAKED array give the values.
 '''
 
+import struct
+
+# Instance attributes which fields must not be lazy about
+RESERVED = {
+    "fields", "vertical", "lo", "hi", "tree", "args", "naked",
+    "pseudofields", "lazy", "this", "width", "maxlines", "line_length",
+}
+
+def fixed_geometry(what):
+    '''
+       (width, format) of a field class with FIXED_WIDTH or PACKED
+       format, format is None for FIXED_WIDTH, None if neither.
+    '''
+    if not isinstance(what, type):
+        return None
+    for cls in what.__mro__:
+        if "PACKED" in vars(cls) or "FIXED_WIDTH" in vars(cls):
+            if what.__init__ is not cls.__init__:
+                return None
+            fmt = vars(cls).get("PACKED")
+            if fmt is not None:
+                return struct.calcsize(fmt), fmt
+            return cls.FIXED_WIDTH, None
+    return None
+
+class Layout():
+    '''
+       The leading fixed-width fields of a field specification
+
+       .fields is a list of (name, what, offset, width, lazy),
+       .packers a list of (struct.Struct, [index into .fields]),
+       .rest the remaining specification, for Struct.add_field()
+    '''
+
+    def __init__(self, struct_class, spec, naked):
+        self.fields = []
+        self.packers = []
+        self.size = 0
+        formats = {}
+        for n, (name, what) in enumerate(spec):
+            geometry = struct_class.field_geometry(what)
+            if geometry is None:
+                break
+            width, fmt = geometry
+            if name in RESERVED or hasattr(struct_class, name):
+                fmt = None
+                lazy = False
+            else:
+                lazy = fmt is not None or not naked
+            if fmt is not None:
+                endian = fmt[0] if fmt[0] in "<>" else "<"
+                formats.setdefault(endian, []).append((self.size, fmt.lstrip("<>"), n))
+            self.fields.append((name, what, self.size, width, lazy))
+            self.size += width
+        self.rest = spec[len(self.fields):]
+        for endian, lst in formats.items():
+            fmt = endian
+            pos = 0
+            for off, code, _n in lst:
+                if off > pos:
+                    fmt += "%dx" % (off - pos)
+                fmt += code
+                pos = off + struct.calcsize(endian + code)
+            self.packers.append((struct.Struct(fmt), [n for _off, _code, n in lst]))
+
+    def unpack(self, octets):
+        ''' Values of the PACKED fields, by index '''
+        vals = {}
+        for packer, idx in self.packers:
+            vals.update(zip(idx, packer.unpack_from(octets)))
+        return vals
+
 class Struct():
     '''
         A composite data structure
@@ -77,8 +169,13 @@ class Struct():
 
     '''
 
+    # (class, specification, naked) -> Layout
+    layouts = {}
+    LAYOUTS = 1 << 12
+
     def __init__(self, tree, lo, vertical=False, more=False, pad=0, naked=False, **kwargs):
-        self.fields = []
+        self._fields = []
+        self.lazy = None
         self.vertical = vertical
         self.lo = lo
         self.hi = lo
@@ -86,21 +183,111 @@ class Struct():
         self.args = {} # XXX: rename
         self.naked = naked
         self.pseudofields = []
+        spec = []
         for name, width in kwargs.items():
             if name[-1] == "_":
-                self.add_field(name[:-1], width)
+                spec.append((name[:-1], width))
             else:
                 self.args[name] = width
+        self.add_fields(spec)
 
         if not more:
             self.done(pad=pad)
 
     def __getattr__(self, what):
         ''' Silence pylint E1101 '''
+        lazy = self.__dict__.get("lazy")
+        if lazy and what in lazy:
+            return self.materialize(what)
         raise AttributeError(
             "'" + self.__class__.__name__ + "' has no attribute '" + str(what) + "'"
         )
 
+    @property
+    def fields(self):
+        ''' The (name, leaf) of all fields '''
+        if self.lazy:
+            for name in list(self.lazy):
+                self.materialize(name)
+        return self._fields
+
+    @fields.setter
+    def fields(self, val):
+        self._fields = val
+
+    @classmethod
+    def field_geometry(cls, what):
+        ''' (width, format) if the width of a field is known in advance '''
+        if isinstance(what, int):
+            if what == 0:
+                return None
+            return abs(what), None
+        return fixed_geometry(what)
+
+    def layout_octets(self, lo, hi):
+        ''' The octets for a layout, None if they are not there '''
+        return None
+
+    def lazy_field(self, what, lo, _width, _val):
+        ''' Make the leaf of a field in a layout '''
+        if isinstance(what, int):
+            return self.number_field(lo, what)
+        return what(self.tree, lo)
+
+    def bulk_values(self, _what, _lo, _count, _width, _fmt):
+        ''' The values of an array of fields, None if they cannot be decoded in bulk '''
+        return None
+
+    def materialize(self, name):
+        ''' Make the leaf of a lazy field '''
+        idx, what, lo, width, val = self.lazy.pop(name)
+        obj = self.lazy_field(what, lo, width, val)
+        if name not in self.__dict__:
+            setattr(self, name, obj)
+        self._fields[idx] = (name, obj)
+        return obj
+
+    def add_fields(self, spec):
+        ''' Add fields, using a compiled layout as far as possible '''
+        try:
+            key = (self.__class__, tuple(spec), self.naked)
+            layout = self.layouts.get(key)
+        except TypeError:
+            key = None
+            layout = None
+        if layout is None and key is not None:
+            if len(self.layouts) >= self.LAYOUTS:
+                # Specifications with classes made on the fly
+                self.layouts.clear()
+            layout = Layout(self.__class__, spec, self.naked)
+            self.layouts[key] = layout
+        octets = b''
+        if layout is not None and layout.fields:
+            octets = self.layout_octets(self.hi, self.hi + layout.size)
+            if octets is None and layout.packers:
+                layout = None
+        if layout is None or not layout.fields or octets is None:
+            for name, what in spec:
+                self.add_field(name, what)
+            return
+        vals = layout.unpack(octets)
+        base = self.hi
+        if self.lazy is None:
+            self.lazy = {}
+        for n, (name, what, off, width, lazy) in enumerate(layout.fields):
+            if not lazy:
+                self.hi = base + off
+                self.add_field(name, what)
+                continue
+            val = vals.get(n)
+            if self.naked and val is not None:
+                setattr(self, name, val)
+            self.lazy[name] = (len(self._fields), what, base + off, width, val)
+            self._fields.append((name, None))
+        self.hi = base + layout.size
+        for name, what in layout.rest:
+            self.add_field(name, what)
+
     def done(self, pad=0):
         ''' Struct is complete, finish up '''
         if pad != 0:
@@ -148,7 +335,7 @@ class Struct():
             setattr(self, name, z.val)
         else:
             setattr(self, name, z)
-        self.fields.append((name, y))
+        self._fields.append((name, y))
         return y
 
     def suffix(self, adr):
@@ -189,6 +376,24 @@ class Struct():
 def Array(struct_class, count, what, vertical=None, naked=False, elide=None):
     ''' An array of things '''
 
+    key = (struct_class, count, what, vertical, naked, elide)
+    try:
+        cls = array_classes.get(key)
+    except TypeError:
+        key = None
+        cls = None
+    if cls is None:
+        cls = make_array(struct_class, count, what, vertical, naked, elide)
+        if key is not None:
+            array_classes[key] = cls
+    return cls
+
+# Classes made by Array(), so that struct layouts can be shared
+array_classes = {}
+
+def make_array(struct_class, count, what, vertical, naked, elide):
+    ''' Make an Array class '''
+
     if count > 0:
 
         class Array_Class(struct_class):
@@ -196,32 +401,129 @@ def Array(struct_class, count, what, vertical=None, naked=False, elide=None):
             COUNT = count
             NAKED = naked
             ELIDE = elide
+            FACTORY = (Array, (struct_class, count, what, vertical, naked, elide))
 
             def __init__(self, *args, **kwargs):
                 if vertical:
                     kwargs["vertical"] = vertical
                 super().__init__(*args, more = True, **kwargs)
-                self.array = []
-                self.items = []
-                for i in range(self.COUNT):
-                    f = self.add_field("f%d" % i, self.WHAT)
-                    self.items.append(f)
-                    if self.NAKED and hasattr(f, "val"):
-                        self.array.append(f.val)
-                    else:
-                        self.array.append(f)
+                self.values = None
+                self._array = None
+                self._items = None
+                geometry = self.field_geometry(self.WHAT)
+                if geometry is not None:
+                    width, fmt = geometry
+                    self.values = self.bulk_values(self.WHAT, self.hi, self.COUNT, width, fmt)
+                if self.values is None:
+                    self._array = []
+                    self._items = []
+                    for i in range(self.COUNT):
+                        f = self.add_field("f%d" % i, self.WHAT)
+                        self._items.append(f)
+                        if self.NAKED and hasattr(f, "val"):
+                            self._array.append(f.val)
+                        else:
+                            self._array.append(f)
+                else:
+                    # Elements are made when asked for
+                    self.first = self.hi
+                    self.stride = width
+                    self.slot = len(self._fields)
+                    self.elements = {}
+                    self._fields.extend([(None, None)] * self.COUNT)
+                    self.hi += width * self.COUNT
                 self.done()
 
+            def __getattr__(self, what):
+                if what[:1] == "f" and what[1:].isdigit() and self.__dict__.get("_items", 0) is None:
+                    _items = self.items
+                    return getattr(self, what)
+                return super().__getattr__(what)
+
+            def element(self, idx):
+                ''' The leaf of a bulk-decoded element '''
+                obj = self.elements.get(idx)
+                if obj is None:
+                    obj = self.lazy_field(
+                        self.WHAT,
+                        self.first + idx * self.stride,
+                        self.stride,
+                        self.values[idx],
+                    )
+                    self.elements[idx] = obj
+                return obj
+
+            @property
+            def items(self):
+                ''' The leaves of the elements '''
+                if self._items is None:
+                    self._items = [self.element(i) for i in range(self.COUNT)]
+                    for i, obj in enumerate(self._items):
+                        name = "f%d" % i
+                        if self.naked and hasattr(obj, "val"):
+                            setattr(self, name, obj.val)
+                        else:
+                            setattr(self, name, obj)
+                        self._fields[self.slot + i] = (name, obj)
+                return self._items
+
+            @property
+            def array(self):
+                ''' The elements, values if NAKED '''
+                if self._array is None:
+                    if self.NAKED and hasattr(self.element(0), "val"):
+                        self._array = list(self.values)
+                    else:
+                        self._array = list(self.items)
+                return self._array
+
+            @property
+            def fields(self):
+                _items = self.items
+                return super().fields
+
+            @fields.setter
+            def fields(self, val):
+                self._fields = val
+
+            def naked_values(self):
+                ''' Can the values stand in for the elements ? '''
+                return (
+                    self._array is None and self.NAKED and
+                    hasattr(self.element(0), "val")
+                )
+
             def __getitem__(self, idx):
-                return self.array[idx]
+                if self._array is not None:
+                    return self._array[idx]
+                if self.naked_values():
+                    return self.values[idx]
+                if isinstance(idx, slice):
+                    return [self.element(i) for i in range(*idx.indices(self.COUNT))]
+                if idx < 0:
+                    idx += self.COUNT
+                if not 0 <= idx < self.COUNT:
+                    raise IndexError("Array index out of range")
+                return self.element(idx)
 
             def __iter__(self):
-                yield from self.array
+                if self._array is not None:
+                    yield from self._array
+                elif self.naked_values():
+                    yield from self.values
+                else:
+                    yield from map(self.element, range(self.COUNT))
 
             def __len__(self):
                 return self.COUNT
 
             def iter_elided(self):
+                if self.values is not None:
+                    for n, val in enumerate(self.values):
+                        if self.ELIDE is not None and val in self.ELIDE:
+                            continue
+                        yield n, self.element(n)
+                    return
                 for n, x in enumerate(self.items):
                     if self.ELIDE is not None and x.val in self.ELIDE:
                         continue
@@ -232,7 +534,7 @@ def Array(struct_class, count, what, vertical=None, naked=False, elide=None):
                     yield '[' + ", ".join("".join(x.render()) for x in self.items) + "]"
                 else:
                     yield '['
-                    i = len("%x" % len(self.items))
+                    i = len("%x" % self.COUNT)
                     fmt = "  [0x%%0%dx]: " % i
                     for n, i in self.iter_elided():
                         for j in i.render():
@@ -250,6 +552,7 @@ def Array(struct_class, count, what, vertical=None, naked=False, elide=None):
     class Array_Class():
         WHAT = what
         COUNT = count
+        FACTORY = (Array, (struct_class, count, what, vertical, naked, elide))
 
         def __init__(self, tree, lo, *args, **kwargs):
             self.tree = tree
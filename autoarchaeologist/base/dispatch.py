@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+    AutoArchaeologist Examiner Dispatch
+    -----------------------------------
+
+    Most examiners reject most artifacts, and with a couple of dozen
+    examiners and hundreds of thousands of artifacts, just calling
+    them to find out is the dominant cost of examination.
+
+    Examiners can declare cheap pre-conditions in a `PRECONDITION`
+    class attribute, and the excavation only calls the examiners
+    whose pre-conditions match the artifact:
+
+        class Compress():
+            PRECONDITION = dispatch.Precondition(
+                magic=b'\\x1f\\x9d',
+                min_length=9,
+            )
+
+    The magic and length conditions are looked up in an index once
+    per artifact, the notes, types and creator conditions are checked
+    right before the examiner would be called, because the examiners
+    called before it may have added notes or types.
+
+    Pre-conditions are only a filter, examiners must still be
+    prepared to reject artifacts they are called on.
+
+    Examiners can also declare a cost `TIER`, the default being
+    `CHEAP`.  All artifacts are examined with the cheapest tier
+    first, and only artifacts which were not taken are examined
+    with the more expensive tiers:
+
+        class FindUnixFs(ov.OctetView):
+            TIER = dispatch.EXPENSIVE
+'''
+
+CHEAP = 0
+EXPENSIVE = 10
+
+class Precondition():
+    '''
+       What an artifact must look like for an examiner to be called
+
+       magic:      Leading octets, bytes or tuple of bytes
+       min_length: Minimum length of artifact
+       max_length: Maximum length of artifact
+       notes:      All of these notes must be present
+       no_notes:   None of these notes may be present
+       types:      All of these types must be present
+       no_types:   None of these types may be present
+       created_by: Artifact created by one of these examiners
+    '''
+
+    def __init__(
+        self,
+        magic=None,
+        min_length=None,
+        max_length=None,
+        notes=(),
+        no_notes=(),
+        types=(),
+        no_types=(),
+        created_by=(),
+    ):
+        if isinstance(magic, bytes):
+            magic = (magic,)
+        self.magic = magic
+        self.min_length = min_length
+        self.max_length = max_length
+        if isinstance(notes, str):
+            notes = (notes,)
+        self.notes = tuple(notes)
+        if isinstance(no_notes, str):
+            no_notes = (no_notes,)
+        self.no_notes = tuple(no_notes)
+        if isinstance(types, str):
+            types = (types,)
+        self.types = tuple(types)
+        if isinstance(no_types, str):
+            no_types = (no_types,)
+        self.no_types = tuple(no_types)
+        if not isinstance(created_by, (tuple, list, set)):
+            created_by = (created_by,)
+        self.created_by = tuple(created_by)
+
+    def __repr__(self):
+        return "<Precondition " + " ".join(
+            "%s=%s" % (x, repr(y)) for x, y in self.__dict__.items() if y
+        ) + ">"
+
+    def length_ok(self, length):
+        ''' Check the length conditions '''
+        if self.min_length is not None and length < self.min_length:
+            return False
+        if self.max_length is not None and length > self.max_length:
+            return False
+        return True
+
+    def matches(self, this):
+        ''' Check the conditions which can change during examination '''
+        for note in self.notes:
+            if note not in this.notes:
+                return False
+        for note in self.no_notes:
+            if note in this.notes:
+                return False
+        for typ in self.types:
+            if typ not in this.types:
+                return False
+        for typ in self.no_types:
+            if typ in this.types:
+                return False
+        if self.created_by and this.created_by not in self.created_by:
+            return False
+        return True
+
+def precondition(examiner):
+    ''' The pre-condition of an examiner, if any '''
+    return getattr(examiner, "PRECONDITION", None)
+
+def tier(examiner):
+    ''' The cost tier of an examiner '''
+    return getattr(examiner, "TIER", CHEAP)
+
+NOTHING = frozenset()
+
+class Dispatch():
+    ''' Index of the examiners by their pre-conditions '''
+
+    def __init__(self, examiners):
+        self.examiners = tuple(examiners)
+        self.tables = {}
+        self.magics = {}
+        for n, ex in enumerate(self.examiners):
+            cond = precondition(ex)
+            if cond is not None and cond.magic:
+                for magic in cond.magic:
+                    i = self.magics.setdefault(len(magic), {})
+                    i.setdefault(bytes(magic), set()).add(n)
+            self.tables.setdefault(tier(ex), []).append((n, ex, cond))
+        self.tiers = sorted(self.tables)
+        if not self.tiers:
+            self.tiers.append(CHEAP)
+
+    def next_tier(self, this_tier):
+        ''' The next more expensive tier, if any '''
+        for i in self.tiers:
+            if i > this_tier:
+                return i
+        return None
+
+    def magic_hits(self, this):
+        ''' Examiners whose magic match '''
+        retval = set()
+        for length, magics in self.magics.items():
+            if len(this) >= length:
+                retval |= magics.get(bytes(this[:length]), NOTHING)
+        return retval
+
+    def examiners_for(self, this, this_tier, order=None):
+        '''
+           The examiners of a tier whose pre-conditions match, in order
+
+           If given, `order` is called with the artifact and the table
+           of the tier, and returns the table in the order to use.
+
+           This is a generator, so that the conditions which can
+           change are checked right before the examiner is called.
+        '''
+        hits = self.magic_hits(this)
+        length = len(this)
+        table = self.tables.get(this_tier, ())
+        if order:
+            table = order(this, table)
+        for n, ex, cond in table:
+            if cond is None:
+                yield ex
+            elif cond.magic and n not in hits:
+                continue
+            elif cond.length_ok(length) and cond.matches(this):
+                yield ex
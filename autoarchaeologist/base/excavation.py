@@ -14,13 +14,24 @@
 '''
 
 import os
+import time
 import tempfile
+import zlib
 
 from . import artifact
 from . import index
 from . import type_case
 from . import result_page
 from . import metrics
+from . import adaptive
+from . import dispatch
+from . import profiling
+from . import watchdog
+from . import residency
+from . import parallel
+from . import findings_cache
+from . import checkpoint
+from . import scheduler as queue_scheduler
 from ..html import decorator
 
 class DuplicateArtifact(Exception):
@@ -89,6 +100,18 @@ class Excavation(result_page.ResultPage):
         html_dir="/tmp/aa",	   # Where to put HTML output
         spill_index=10,		   # Spill limit for index lines
         cache_dir=None,		   # Cache directory for collections
+        jobs=1,			   # Worker processes for examination
+        cache_findings=False,	   # Cache examination findings in cache_dir
+        checkpoint_interval=None,  # Seconds between checkpoints in cache_dir
+        scheduler=None,		   # Queue scheduler, see base/scheduler.py
+        time_budget=None,	   # Seconds before expensive examiners are skipped
+        adaptive_order=False,	   # Order examiners by take-rates in cache_dir
+        examiner_cpu_limit=None,   # CPU seconds per examiner call
+        examiner_memory_limit=None, # Octets of memory per examiner call
+        prehash=False,		   # Find duplicates with CRC32 before SHA256
+        spill_threshold=None,	   # Map artifacts this large from .back files
+        resident_budget=None,	   # Octets of mapped files to keep resident
+        profile=False,		   # Write the examiner profile, see base/profiling.py
     ):
 
         super().__init__()
@@ -111,17 +134,61 @@ class Excavation(result_page.ResultPage):
         self.digest_prefix = digest_prefix
         self.downloads = downloads
         self.download_links = download_links
+        self.profile = profile
         self.download_limit = download_limit
         self.html_dir = html_dir
         self.spill_index = spill_index
+        self.jobs = jobs
+        if scheduler is None:
+            scheduler = queue_scheduler.FifoQueue
+        self.scheduler = scheduler
+        self.time_budget = time_budget
+        self.t0 = None
+        if cache_findings:
+            self.findings_cache = findings_cache.FindingsCache(
+                self,
+                self.get_cache_subdir("Findings"),
+            )
+        else:
+            self.findings_cache = None
+        if adaptive_order:
+            self.adaptive = adaptive.AdaptiveOrder(
+                self,
+                self.get_cache_subdir("Adaptive"),
+            )
+        else:
+            self.adaptive = None
+        if checkpoint_interval is not None:
+            self.checkpoint = checkpoint.Checkpoint(self, checkpoint_interval)
+        else:
+            self.checkpoint = None
 
         self.decorator = None
 
         self.hashes = {}
+        if prehash:
+            self.prehashes = {}	# length -> {artifact: crc32 or None}
+        else:
+            self.prehashes = None
         self.busy = True
-        self.queue = []
+        self.queue = self.new_queue()
         self.examiners = []
+        self.dispatch = None
+        self.examiner = None	# The examiner currently running
+        self.phase = None	# For checkpoints
+        self.profiler = profiling.Profiler()
+        self.watchdog = watchdog.Watchdog(
+            self,
+            cpu_limit=examiner_cpu_limit,
+            memory_limit=examiner_memory_limit,
+        )
+        self.residency = residency.Residency(
+            self,
+            threshold=spill_threshold,
+            budget=resident_budget,
+        )
         self.names = set()
+        self.backing_files = {}	# digest -> TempFile, see .backing_for()
 
         # Free for all dictionary for joining multi-volume artifacts.
         self.multivol = {}
@@ -135,11 +202,16 @@ class Excavation(result_page.ResultPage):
         self.relpath = "index.html"
 
         self.unique_counter = 10000
+        self.temp_tag = ""
 
     def __lt__(self, other):
         # Duck-type as Artifact
         return -1
 
+    def new_queue(self):
+        ''' Create an (empty) examination queue '''
+        return self.scheduler(self)
+
     def get_unique(self):
         ''' Produce unique numbers '''
         self.unique_counter += 1
@@ -152,6 +224,7 @@ class Excavation(result_page.ResultPage):
             print("Proposed artifact is empty", this)
             return
         this.top = self
+        this.created_by = self.examiner
         self.add_artifact(this)
         this.adopted()
 
@@ -159,6 +232,7 @@ class Excavation(result_page.ResultPage):
         ''' Add an artifact, and start examining it '''
         assert isinstance(this, artifact.Artifact)
         assert this.digest not in self.hashes
+        self.residency.adopt(this)
         self.hashes[this.digest] = this
         self.queue.append(this)
         if this.type_case is None:
@@ -166,6 +240,36 @@ class Excavation(result_page.ResultPage):
         if not self.busy:
             self.examine()
 
+    def find_prehashed(self, octets):
+        '''
+           Find an artifact with these octets in the pre-hash index
+
+           The artifacts are indexed by length, and the CRC32s are
+           only calculated, once, when there is more than one
+           artifact of a length.
+
+           Returns the key for `add_prehashed()` and the artifact,
+           or None, None if pre-hashing is not enabled.
+        '''
+        if self.prehashes is None:
+            return None, None
+        same_length = self.prehashes.get(len(octets))
+        if not same_length:
+            return (len(octets), None), None
+        crc = zlib.crc32(octets)
+        for that, that_crc in same_length.items():
+            if that_crc is None:
+                that_crc = zlib.crc32(that.bdx)
+                same_length[that] = that_crc
+            if that_crc == crc and artifact.same_octets(that.bdx, octets):
+                return (len(octets), crc), that
+        return (len(octets), crc), None
+
+    def add_prehashed(self, key, this):
+        ''' Add an artifact to the pre-hash index '''
+        length, crc = key
+        self.prehashes.setdefault(length, {})[this] = crc
+
     def add_examiner(self, *args):
         ''' Add an examiner function(s) '''
         for i in args:
@@ -202,24 +306,97 @@ class Excavation(result_page.ResultPage):
         self.examine()
 
     def examine(self):
-        ''' Explore all artifacts serially '''
+        ''' Explore all artifacts '''
         assert not self.busy
         self.busy = True
-        while self.queue:
-            this = self.queue.pop(0)
-            for ex in self.examiners:
-                ex(this)
-                if this.taken:
-                    break
-        for that in list(self.hashes.values()):
-            that.part()
-        while self.queue:
-            this = self.queue.pop(0)
-            for ex in self.examiners:
-                ex(this)
-                if this.taken:
-                    break
+        if self.t0 is None:
+            self.t0 = time.time()
+        if self.findings_cache:
+            self.findings_cache.replay_queue()
+        if self.jobs > 1 and len(self.queue) > 1:
+            parallel.examine(self)
+        elif self.findings_cache:
+            self.findings_cache.examine_queue()
+        self.finish_examination("examine")
+
+    def finish_examination(self, phase):
+        ''' Examine the queue, part the artifacts and examine the rest '''
+        if phase == "examine":
+            self.phase = phase
+            self.examine_queue()
+            for that in list(self.hashes.values()):
+                that.part()
+        self.phase = "part"
+        self.examine_queue()
         self.busy = False
+        if self.adaptive:
+            self.adaptive.save()
+        if self.checkpoint:
+            self.checkpoint.save("done")
+
+    def resume_checkpoint(self):
+        '''
+           Resume from a checkpoint, if there is one
+
+           Returns True if the examination is complete,
+           the checkpoint has restored all artifacts, and
+           the next step is produce_html()
+        '''
+        if not self.checkpoint:
+            return False
+        phase = self.checkpoint.load()
+        if phase is None:
+            return False
+        if phase != "done":
+            self.t0 = time.time()
+            self.busy = True
+            self.finish_examination(phase)
+        return True
+
+    def examine_queue(self):
+        ''' Explore the queued artifacts serially '''
+        if self.dispatch is None or self.dispatch.examiners != tuple(self.examiners):
+            self.dispatch = dispatch.Dispatch(self.examiners)
+        tier = self.dispatch.tiers[0]
+        while True:
+            if self.queue:
+                self.examine_tier(self.queue.pop(), tier)
+            else:
+                deferred = self.queue.pop_deferred()
+                if deferred is None:
+                    break
+                if self.over_budget():
+                    self.profiler.skip(deferred[1], deferred[0])
+                    continue
+                self.examine_tier(deferred[1], deferred[0])
+            if self.checkpoint and self.checkpoint.due():
+                self.checkpoint.save(self.phase)
+
+    def examine_tier(self, this, tier):
+        ''' Examine with one tier of examiners, defer to the next if not taken '''
+        self.residency.touch(this)
+        if self.adaptive:
+            order = self.adaptive.order
+        else:
+            order = None
+        for ex in self.dispatch.examiners_for(this, tier, order):
+            self.examiner = ex
+            elapsed = self.profiler.call(ex, this, self.watchdog)
+            if self.adaptive:
+                self.adaptive.record(this, ex, elapsed, this.taken)
+            if this.taken:
+                break
+        self.examiner = None
+        if not this.taken:
+            tier = self.dispatch.next_tier(tier)
+            if tier is not None:
+                self.queue.defer(this, tier)
+
+    def over_budget(self):
+        ''' Has the time budget run out ? '''
+        if self.time_budget is None or self.t0 is None:
+            return False
+        return time.time() - self.t0 > self.time_budget
 
     def polish(self):
         ''' Polish things up before HTML production '''
@@ -250,12 +427,26 @@ class Excavation(result_page.ResultPage):
         ''' Come up with a suitable file for an artifact '''
         base = self.basename_for(this, suf)
         if temp:
-            return TempFile(os.path.join(self.html_dir, base + ".%d" % self.get_unique()))
+            return TempFile(os.path.join(self.html_dir, base + "%s.%d" % (self.temp_tag, self.get_unique())))
         return OutputFile(
             base,
             os.path.join(self.html_dir, base),
         )
 
+    def backing_for(self, this):
+        '''
+           The `.back` file of an artifact, removed with the excavation
+
+           (ArtifactFragmented keeps its own, see .adopted())
+        '''
+        retval = self.backing_files.get(this.digest)
+        if retval is None:
+            retval = TempFile(
+                os.path.join(self.html_dir, self.basename_for(this, ".back"))
+            )
+            self.backing_files[this.digest] = retval
+        return retval
+
     def produce_html(self):
         ''' Produce default HTML pages '''
 
@@ -268,6 +459,9 @@ class Excavation(result_page.ResultPage):
 
         self.decorator.produce_html()
 
+        if self.checkpoint:
+            self.checkpoint.remove()
+
         return self.html_dir
 
     def html_link_to(self, this, link_text=None, anchor=None, **kwargs):
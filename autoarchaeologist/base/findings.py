@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+    AutoArchaeologist Findings
+    --------------------------
+
+    `Findings` are what came out of examining one artifact and
+    everything derived from it: The artifacts with their types,
+    notes, names, layout, namespaces, records and interpretations.
+
+    Findings can be pickled, with all references to artifacts
+    replaced by their digest, and later merged into an excavation,
+    possibly in another process or another run.
+
+    Artifacts which already exist in the excavation when findings
+    are merged, only get the linkage (parents, names, notes…) from
+    the findings, just like `Artifact.create()` does for duplicates.
+
+    The content of new artifacts is described either as a slice
+    of another artifact or as a backing file.
+
+    Findings cannot be pickled if an interpretation holds on to
+    something unpicklable, such as a memoryview, and the examination
+    is not self-contained if it used the excavation-global
+    dictionaries (`.by_class`, `.multivol`) used for joining
+    artifacts across media, even just to look something up.  In both cases the caller must fall
+    back to plain examination.
+'''
+
+import os
+import mmap
+import pickle
+
+from . import artifact
+from . import interpretation
+
+# These are accumulated, rather than overwritten, when merging
+LINKAGE = (
+    "parents",
+    "types",
+    "notes",
+    "descriptions",
+    "names",
+    "namespaces",
+)
+
+class FindingsError(Exception):
+    ''' Findings cannot be saved or merged '''
+
+class Watched(dict):
+    ''' A dict which notes if it is used at all '''
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.used = False
+
+    def __contains__(self, key):
+        # Not a use if it misses, tar_file.py looks for TarFile
+        # in .by_class of the parent, which may be the excavation
+        retval = super().__contains__(key)
+        self.used |= retval
+        return retval
+
+def _watch(name):
+    method = getattr(dict, name)
+    def watched(self, *args, **kwargs):
+        self.used = True
+        return method(self, *args, **kwargs)
+    watched.__name__ = name
+    setattr(Watched, name, watched)
+
+for _name in (
+    "__getitem__", "__setitem__", "__delitem__", "__iter__", "__len__",
+    "get", "setdefault", "pop", "popitem", "update", "clear",
+    "keys", "values", "items",
+):
+    _watch(_name)
+
+def content_of(that):
+    ''' The octets of an artifact '''
+    if isinstance(that, artifact.ArtifactFragmented):
+        return that.materialize()
+    return that.bdx
+
+def map_file(filename):
+    ''' Read or mmap a backing file, same policy as ArtifactFragmented '''
+    with open(filename, "rb") as file:
+        if os.fstat(file.fileno()).st_size < (1<<16):
+            return memoryview(file.read()).toreadonly()
+        return memoryview(
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        ).toreadonly()
+
+def slice_of_parent(that):
+    ''' Find an ArtifactStream in the layout of a parent, if possible '''
+    if isinstance(that, artifact.ArtifactFragmented):
+        return None
+    for parent in that.parents:
+        if parent == that.top:
+            continue
+        for lo, hi, child in parent.layout:
+            if child == that and hi - lo == len(that):
+                if content_of(parent)[lo:hi] == that.bdx:
+                    return ("slice", parent, lo, hi)
+    return None
+
+def record_state(rec):
+    ''' Reconstruct a Record, the .frag is re-sliced after loading '''
+    retval = artifact.Record.__new__(artifact.Record)
+    retval.__dict__.update(rec)
+    retval.frag = None
+    return retval
+
+def stashed_file(cls, state, _name):
+    ''' Reconstruct an object whose file was stashed (see Unpickler) '''
+    retval = cls.__new__(cls)
+    retval.__dict__.update(state)
+    return retval
+
+class Pickler(pickle.Pickler):
+    '''
+       Pickle findings with artifacts replaced by (digest, class)
+
+       If `stash` is given, it is called with the filenames of
+       interpretations, and must return a name for `Unpickler.unstash`
+    '''
+
+    def __init__(self, file, top, stash=None):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.top = top
+        self.stash = stash
+
+    def persistent_id(self, obj):
+        if obj is self.top:
+            return "top"
+        if isinstance(obj, artifact.Artifact):
+            return (obj.digest, obj.__class__)
+        return None
+
+    def reducer_override(self, obj):
+        if isinstance(obj, type):
+            # Classes made by factory functions, see for instance ov.Text()
+            if "<locals>" in obj.__qualname__ and "FACTORY" in obj.__dict__:
+                return obj.FACTORY
+            return NotImplemented
+        if isinstance(obj, artifact.Record):
+            if obj.artifact is None:
+                raise pickle.PicklingError("Record without artifact " + repr(obj))
+            state = dict(obj.__dict__)
+            del state["frag"]
+            return (record_state, (state,))
+        if self.stash and isinstance(obj, interpretation.HtmlInterpretation):
+            state = dict(obj.__dict__)
+            return (stashed_file, (obj.__class__, state, self.stash(obj.filename)))
+        return NotImplemented
+
+class Unpickler(pickle.Unpickler):
+    '''
+       Resolve (digest, class) to existing artifacts or new shells
+
+       If `unstash` is given, it is called with the names `Pickler.stash`
+       returned, and must return the filename to use.
+    '''
+
+    def __init__(self, file, top, unstash=None):
+        super().__init__(file)
+        self.top = top
+        self.unstash = unstash
+        self.shells = {}
+        self.records = []
+
+    def persistent_load(self, pid):
+        if pid == "top":
+            return self.top
+        digest, cls = pid
+        retval = self.top.hashes.get(digest)
+        if retval is None:
+            retval = self.shells.get(digest)
+        if retval is None:
+            retval = cls.__new__(cls)
+            retval.digest = digest	# Needed by __hash__ during loading
+            self.shells[digest] = retval
+        return retval
+
+    def find_class(self, module, name):
+        if module == __name__ and name == "record_state":
+            return self.load_record
+        if module == __name__ and name == "stashed_file":
+            return self.load_stashed_file
+        return super().find_class(module, name)
+
+    def load_record(self, state):
+        ''' Keep track of records so we can restore their .frag '''
+        retval = record_state(state)
+        self.records.append(retval)
+        return retval
+
+    def load_stashed_file(self, cls, state, name):
+        ''' Give the object a fresh copy of its file '''
+        retval = stashed_file(cls, state, name)
+        retval.filename = self.unstash(name)
+        return retval
+
+class Findings():
+    ''' Examine an artifact, and everything derived from it, separately '''
+
+    def __init__(self, top, this):
+        self.top = top
+        self.this = this
+        self.known = set(top.hashes)
+        self.joiners_used = False
+        self.new = []
+
+    def examine(self):
+        ''' Examine, the same way `Excavation.examine()` would '''
+        top = self.top
+        queue = top.queue
+        top.queue = top.new_queue()
+        top.queue.append(self.this)
+        checkpoint = top.checkpoint
+        top.checkpoint = None
+        # Any use of these, even a look, makes the findings depend on
+        # other artifacts
+        top.by_class = Watched(top.by_class)
+        top.multivol = Watched(top.multivol)
+        try:
+            top.examine_queue()
+            for that in [self.this] + self.new_artifacts():
+                that.part()
+            top.examine_queue()
+        finally:
+            self.joiners_used = top.by_class.used or top.multivol.used
+            top.by_class = dict(top.by_class)
+            top.multivol = dict(top.multivol)
+        top.checkpoint = checkpoint
+        top.queue = queue
+        self.new = self.new_artifacts()
+
+    def new_artifacts(self):
+        ''' Artifacts created since we started '''
+        return [x for x in self.top.hashes.values() if x.digest not in self.known]
+
+    def self_contained(self):
+        ''' The examination did not use excavation wide state '''
+        return not self.joiners_used
+
+    def table(self, backing=None):
+        '''
+           Build the pickle-able table of findings
+
+           New artifacts which are not slices of their parent
+           must have their content in a file, `backing` is called
+           to produce the name of that file.
+        '''
+        if not self.self_contained():
+            raise FindingsError("Examination used excavation wide state")
+        if backing is None:
+            backing = self.backing_file
+        new = set(self.new)
+        examined = [self.this] + self.new
+        linked = set()
+        for that in examined:
+            for other in list(that.children) + list(that.parents):
+                if other != self.top and other.digest in self.known and other != self.this:
+                    linked.add(other)
+
+        retval = []
+        for that in examined:
+            content = None
+            if that in new:
+                content = slice_of_parent(that)
+                if content is None:
+                    content = ("file", backing(that))
+            state = {
+                x: y for x, y in that.__dict__.items()
+                if not isinstance(y, (memoryview, mmap.mmap))
+            }
+            retval.append((that, True, content, state))
+        for that in sorted(linked):
+            state = {x: that.__dict__[x] for x in LINKAGE}
+            retval.append((that, False, None, state))
+        return retval
+
+    def backing_file(self, that):
+        ''' The `.back` file of an artifact, written if need be '''
+        if isinstance(that, artifact.ArtifactFragmented):
+            return that.backing_filename()
+        backing = self.top.backing_for(that)
+        # NB: It may be mapped already, see base/residency.py
+        if not os.path.exists(backing.filename) or os.path.getsize(backing.filename) != len(that):
+            with open(backing.filename, "wb") as file:
+                that.writetofile(file)
+        return backing.filename
+
+    def dump(self, file, backing=None, stash=None):
+        ''' Pickle the findings '''
+        Pickler(file, self.top, stash=stash).dump(self.table(backing))
+
+class Merger():
+    ''' Merge pickled findings into an excavation '''
+
+    def __init__(self, top, this, file, unstash=None, restore=None):
+        self.top = top
+        self.this = this
+        self.restore = restore
+        loader = Unpickler(file, top, unstash=unstash)
+        self.table = loader.load()
+        self.shells = loader.shells
+        self.records = loader.records
+
+        self.full = set()
+        for that, examined, _content, _state in self.table:
+            if examined and (that.digest in self.shells or that == self.this):
+                self.full.add(that)
+        for digest, that in self.shells.items():
+            if that not in self.full:
+                raise FindingsError("Findings refer to unknown artifact " + digest)
+
+    def merge(self):
+        ''' Merge the findings '''
+        for rec in self.records:
+            # While the existing artifacts still have their own fragments
+            if rec.artifact.digest not in self.shells:
+                rec.frag = rec.artifact[rec.lo:rec.hi]
+        for that, _examined, content, state in self.table:
+            if that in self.full:
+                for key, val in state.items():
+                    if key not in LINKAGE:
+                        that.__dict__[key] = val
+                    elif key not in that.__dict__:
+                        that.__dict__[key] = val.__class__()
+            self.merge_linkage(that, state)
+            if that.digest in self.shells:
+                that.findings_content = content
+
+        for that in self.shells.values():
+            self.restore_content(that)
+            self.top.hashes[that.digest] = that
+        for rec in self.records:
+            if rec.frag is None:
+                rec.frag = content_of(rec.artifact)[rec.lo:rec.hi]
+
+    def merge_linkage(self, that, state):
+        ''' Accumulate the linkage attributes '''
+        that.parents |= state["parents"]
+        for typ, lst in state["types"].items():
+            for kwargs in lst:
+                that.add_type(typ, **kwargs)
+        for note, lst in state["notes"].items():
+            for kwargs in lst:
+                that.add_note(note, **kwargs)
+        for desc in state["descriptions"]:
+            if desc not in that.descriptions:
+                that.descriptions.append(desc)
+        that.names |= state["names"]
+        for key, nsps in state["namespaces"].items():
+            for nsp in nsps:
+                if nsp.ns_root in self.full:
+                    lst = that.namespaces.setdefault(key, [])
+                    if nsp not in lst:
+                        lst.append(nsp)
+
+    def restore_content(self, that):
+        '''
+           Give a new artifact its octets
+
+           The content is either ("slice", parent, lo, hi) or
+           ("file", filename), in the latter case the `restore`
+           function can copy the file into place first, otherwise
+           the file, written by a worker, is taken over.
+        '''
+        content = that.__dict__.pop("findings_content", None)
+        if content is None:
+            return
+        if content[0] == "slice":
+            _kind, parent, lo, hi = content
+            self.restore_content(parent)
+            octets = content_of(parent)[lo:hi]
+        else:
+            filename = content[1]
+            if self.restore:
+                filename = self.restore(that, filename)
+            elif not isinstance(that, artifact.ArtifactFragmented):
+                backing = self.top.backing_for(that)
+                if filename != backing.filename:
+                    os.replace(filename, backing.filename)
+                filename = backing.filename
+            octets = map_file(filename)
+        if isinstance(that, artifact.ArtifactFragmented):
+            that._map = octets
+        else:
+            that.bdx = octets
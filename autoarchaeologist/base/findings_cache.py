@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+    AutoArchaeologist Findings Cache
+    --------------------------------
+
+    With `Excavation(cache_findings=True)` the `Findings` from
+    examining each queued (usually top-level) artifact are saved
+    in the "Findings" subdirectory of the cache_dir, and replayed
+    instead of examined again in later runs.
+
+    The cache is keyed by the digest of the artifact and a fingerprint
+    of the examiners and the source code of the modules they, and
+    the AutoArchaeologist itself, are made of, so editing an examiner
+    invalidates the cache.
+
+    Each entry holds the pickled findings, the content of the derived
+    artifacts which are not simple slices of their parent, and the
+    files of the interpretations.
+
+    Findings which refer to artifacts not present when they are
+    replayed, for instance because they were found in another
+    top-level artifact in the run which saved them, are ignored,
+    and the artifact is examined again.
+'''
+
+import os
+import sys
+import shutil
+import hashlib
+import importlib.util
+
+from . import findings
+
+def source_modules(top):
+    ''' The loaded modules the examination depends on '''
+    modules = {"__main__", top.__class__.__module__}
+    for ex in top.examiners:
+        modules.add(ex.__module__)
+    return [
+        name for name in sorted(sys.modules)
+        if name in modules or name.split(".")[0] == "autoarchaeologist"
+    ]
+
+def source_of(name):
+    ''' The source of a module, loaded or not, None if it has none '''
+    module = sys.modules.get(name)
+    if module is not None:
+        filename = getattr(module, "__file__", None)
+    else:
+        try:
+            spec = importlib.util.find_spec(name)
+        except (ImportError, ValueError):
+            return None
+        filename = spec and spec.origin
+    if not filename or not os.path.isfile(filename):
+        return None
+    with open(filename, "rb") as file:
+        return file.read()
+
+class FindingsCache():
+    ''' On-disk cache of `Findings` '''
+
+    def __init__(self, top, path):
+        self.top = top
+        self.path = path
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_fingerprint(self):
+        ''' Fingerprint of the examiners and their source code '''
+        if self.fingerprint:
+            return self.fingerprint
+        i = hashlib.sha256()
+        for ex in self.top.examiners:
+            i.update((ex.__module__ + "." + ex.__qualname__ + "\n").encode("utf8"))
+        for name in source_modules(self.top):
+            source = source_of(name)
+            if source is None:
+                continue
+            i.update(name.encode("utf8"))
+            i.update(source)
+        self.fingerprint = i.hexdigest()
+        return self.fingerprint
+
+    def entry_dir(self, this):
+        ''' The directory for an artifact '''
+        return os.path.join(
+            self.path,
+            self.get_fingerprint()[:16],
+            this.digest[:2],
+            this.digest,
+        )
+
+    def replay_queue(self):
+        ''' Replay the findings of the queued artifacts we have '''
+        for this in self.top.queue.drain():
+            if not self.replay(this):
+                self.top.queue.append(this)
+
+    def replay(self, this):
+        ''' Replay the findings of an artifact, return success '''
+        entry = self.entry_dir(this)
+        filename = os.path.join(entry, "findings.pickle")
+
+        def unstash(name):
+            # NB: The TempFile must be gone before we copy the file
+            filename = self.top.filename_for(self.top, suf=".tmp", temp=True).filename
+            shutil.copyfile(os.path.join(entry, name), filename)
+            return filename
+
+        def restore(that, name):
+            backing = self.top.backing_for(that)
+            if not os.path.exists(backing.filename):
+                shutil.copyfile(os.path.join(entry, name), backing.filename)
+            return backing.filename
+
+        try:
+            with open(filename, "rb") as file:
+                merger = findings.Merger(
+                    self.top,
+                    this,
+                    file,
+                    unstash=unstash,
+                    restore=restore,
+                )
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        except Exception as err:
+            print(this, "Cached findings failed to load", err)
+            self.misses += 1
+            return False
+        merger.merge()
+        self.hits += 1
+        return True
+
+    def examine_queue(self):
+        ''' Examine the queued artifacts one by one, and save the findings '''
+        for this in self.top.queue.drain():
+            fnd = findings.Findings(self.top, this)
+            fnd.examine()
+            self.save(fnd)
+
+    def save(self, fnd):
+        ''' Save findings in the cache '''
+        entry = self.entry_dir(fnd.this)
+        if os.path.isdir(entry):
+            return
+        tmpdir = entry + ".tmp.%d" % os.getpid()
+        os.makedirs(tmpdir, exist_ok=True)
+        stashed = []
+
+        def stash(filename):
+            name = "i%d" % len(stashed)
+            shutil.copyfile(filename, os.path.join(tmpdir, name))
+            stashed.append(name)
+            return name
+
+        def backing(that):
+            name = that.digest + ".back"
+            shutil.copyfile(fnd.backing_file(that), os.path.join(tmpdir, name))
+            return name
+
+        try:
+            with open(os.path.join(tmpdir, "findings.pickle"), "wb") as file:
+                fnd.dump(file, backing=backing, stash=stash)
+            os.rename(tmpdir, entry)
+        except Exception as err:
+            print(fnd.this, "Findings not cached", err)
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -7,18 +7,53 @@
 '''
    Toolkit for operating on artifacts on byte granularity
    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+   Run this module with the filename of an image to see the memory
+   used per leaf, with the common attributes in slots, and in the
+   instance dict as previously:
+
+       python3 -m autoarchaeologist.base.octetview disk.img
 '''
 
 
-from itertools import zip_longest
+import sys
+import array
 
 from . import bintree
 from . import datastruct
 
+# Classes made by Text(), so that struct layouts can be shared
+class_cache = {}
+
+def reorder(octets, byte_order):
+    '''
+       Permute the octets in groups of len(byte_order), the
+       last group is padded with zeros if it is short.
+    '''
+    width = len(byte_order)
+    data = bytes(octets)
+    pad = -len(data) % width
+    if pad:
+        data += bytes(pad)
+    retval = bytearray(len(data))
+    for dst, src in enumerate(byte_order):
+        retval[dst::width] = data[src::width]
+    return bytes(retval)
+
 # Base leaf type
 
 class Octets(bintree.BinTreeLeaf):
-    ''' Base class, just some random octets '''
+    '''
+       Base class, just some random octets
+
+       The common attributes are slots, subclasses can still add
+       others, but the instance dict is only made if they do.
+    '''
+
+    __slots__ = ("tree", "this", "width", "__dict__")
+
+    maxlines = None
+    line_length = None
 
     def __init__(self, tree, lo, width=None, hi=None, maxlines=None, line_length=None):
         if hi is None:
@@ -31,9 +66,11 @@ class Octets(bintree.BinTreeLeaf):
         super().__init__(lo, hi)
         self.tree = tree
         self.this = tree.this
-        self.width = len(self)
-        self.maxlines = maxlines
-        self.line_length = line_length
+        self.width = hi - lo
+        if maxlines is not None:
+            self.maxlines = maxlines
+        if line_length is not None:
+            self.line_length = line_length
 
     def __getitem__(self, idx):
         return self.this[self.lo + idx]
@@ -59,13 +96,7 @@ class Octets(bintree.BinTreeLeaf):
             yield from self.octets()
             return
 
-        def group(data, chunk):
-            i = [iter(data)] * chunk
-            return zip_longest(*i, fillvalue=0)
-
-        for i in group(self.octets(), len(self.this.byte_order)):
-            for j in self.this.byte_order:
-                yield i[j]
+        yield from reorder(self.octets(), self.this.byte_order)
 
     def insert(self):
         ''' Insert in tree (NB: You dont have to do this) '''
@@ -167,6 +198,8 @@ class Elided(Octets):
 class HexOctets(Octets):
     ''' Octets rendered without text column '''
 
+    __slots__ = ()
+
     def render(self):
         yield "".join("%02x" % i for i in self)
 
@@ -175,11 +208,21 @@ class HexOctets(Octets):
 def Text(width, rstrip=False):
     ''' Produce class for width text String (convenient for Struct) '''
 
+    key = ("Text", width, rstrip)
+    cls = class_cache.get(key)
+    if cls:
+        return cls
+
     class Text_Class(Octets):
         ''' Fixed width text String (convenient for Struct) '''
 
         WIDTH = width
+        FIXED_WIDTH = width
         RSTRIP = rstrip
+        FACTORY = (Text, (width, rstrip))
+
+        __slots__ = ("type_case", "txt")
+
         def __init__(self, *args, type_case=None, **kwargs):
             kwargs["width"] = self.WIDTH
             super().__init__(*args, **kwargs)
@@ -197,6 +240,7 @@ def Text(width, rstrip=False):
         def render(self):
             yield "»" + self.txt + "«"
 
+    class_cache[key] = Text_Class
     return Text_Class
 
 class String(Octets):
@@ -230,6 +274,10 @@ class PascalString(Octets):
 class Octet(Octets):
     ''' A single octet (convenient for Struct) '''
 
+    PACKED = "B"
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=1, **kwargs)
         self.val = self.this[lo]
@@ -240,6 +288,10 @@ class Octet(Octets):
 class Le16(Octets):
     ''' Two bytes Little Endian '''
 
+    PACKED = "<H"
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=2, **kwargs)
         self.val = self.this[lo + 1] << 8
@@ -251,6 +303,10 @@ class Le16(Octets):
 class Ls16(Octets):
     ''' Two bytes Big Endian '''
 
+    PACKED = "<h"
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=2, **kwargs)
         self.val = self.this[lo + 1] << 8
@@ -267,6 +323,10 @@ class Ls16(Octets):
 class Le24(Octets):
     ''' Three bytes Little Endian '''
 
+    FIXED_WIDTH = 3
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=3, **kwargs)
         self.val = self.this[lo + 2] << 16
@@ -279,6 +339,10 @@ class Le24(Octets):
 class Le32(Octets):
     ''' Four bytes Little Endian '''
 
+    PACKED = "<I"
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=4, **kwargs)
         self.val = self.this[lo + 3] << 24
@@ -292,6 +356,10 @@ class Le32(Octets):
 class Le64(Octets):
     ''' Eight bytes Little Endian '''
 
+    PACKED = "<Q"
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=8, **kwargs)
         self.val = self.this[lo + 7] << 56
@@ -309,6 +377,10 @@ class Le64(Octets):
 class Be16(Octets):
     ''' Two bytes Big Endian '''
 
+    PACKED = ">H"
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=2, **kwargs)
         self.val = self.this[lo] << 8
@@ -320,6 +392,10 @@ class Be16(Octets):
 class Bs16(Octets):
     ''' Two bytes Big Endian, Signed '''
 
+    PACKED = ">h"
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=2, **kwargs)
         self.val = self.this[lo] << 8
@@ -336,6 +412,10 @@ class Bs16(Octets):
 class Be24(Octets):
     ''' Three bytes Big Endian '''
 
+    FIXED_WIDTH = 3
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=3, **kwargs)
         self.val = self.this[lo] << 16
@@ -348,6 +428,10 @@ class Be24(Octets):
 class Bs24(Octets):
     ''' Three bytes Big Endian '''
 
+    FIXED_WIDTH = 3
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=3, **kwargs)
         self.val = self.this[lo] << 16
@@ -365,6 +449,10 @@ class Bs24(Octets):
 class Be32(Octets):
     ''' Four bytes Big Endian '''
 
+    PACKED = ">I"
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=4, **kwargs)
         self.val = self.this[lo + 0] << 24
@@ -378,6 +466,10 @@ class Be32(Octets):
 class Be64(Octets):
     ''' Eight bytes Big Endian '''
 
+    PACKED = ">Q"
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=8, **kwargs)
         self.val = self.this[lo + 0] << 56
@@ -395,6 +487,10 @@ class Be64(Octets):
 class L2301(Octets):
     ''' Four bytes Deranged Endian '''
 
+    FIXED_WIDTH = 4
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=4, **kwargs)
         self.val = self.this[lo + 2] << 24
@@ -408,6 +504,10 @@ class L2301(Octets):
 class L1032(Octets):
     ''' Four bytes Demented Endian '''
 
+    FIXED_WIDTH = 4
+
+    __slots__ = ("val",)
+
     def __init__(self, tree, lo, **kwargs):
         super().__init__(tree, lo, width=4, **kwargs)
         self.val = self.this[lo + 1] << 24
@@ -453,21 +553,31 @@ class Struct(datastruct.Struct, Octets):
             datastruct.Struct.__init__(self, *args, **kwargs)
         else:
             datastruct.Struct.__init__(self, *args, more=True, **kwargs)
-            assert self.TYPES is not None
-            for i in self.FIELDS:
+            self.add_fields(self.fields_spec())
+            self.done()
+
+    @classmethod
+    def fields_spec(cls):
+        ''' FIELDS with the TYPES resolved, once per class '''
+        spec = cls.__dict__.get("_fields_spec")
+        if spec is None:
+            assert cls.TYPES is not None
+            spec = []
+            for i in cls.FIELDS:
                 if len(i) == 3:
-                    name, cls, dim = i
-                    if isinstance(cls, str):
-                        cls = getattr(self.TYPES, cls)
-                    self.add_field(name, Array(dim, cls))
+                    name, what, dim = i
+                    if isinstance(what, str):
+                        what = getattr(cls.TYPES, what)
+                    spec.append((name, Array(dim, what)))
                 elif len(i) == 2:
-                    name, cls = i
-                    if isinstance(cls, str):
-                        cls = getattr(self.TYPES, cls)
-                    self.add_field(name, cls)
+                    name, what = i
+                    if isinstance(what, str):
+                        what = getattr(cls.TYPES, what)
+                    spec.append((name, what))
                 else:
                     assert False
-            self.done()
+            cls._fields_spec = spec
+        return spec
 
     def base_init(self, **kwargs):
         Octets.__init__(self, self.tree, self.lo, hi=self.hi, **kwargs)
@@ -475,6 +585,41 @@ class Struct(datastruct.Struct, Octets):
     def number_field(self, offset, width):
         return HexOctets(self.tree, offset, width=width)
 
+    @classmethod
+    def field_geometry(cls, what):
+        if isinstance(what, int):
+            if what <= 0:
+                return None
+            return what, None
+        return datastruct.fixed_geometry(what)
+
+    def layout_octets(self, lo, hi):
+        if hi > len(self.tree.this):
+            return None
+        return self.tree.this[lo:hi]
+
+    def lazy_field(self, what, lo, width, val):
+        if val is None:
+            return super().lazy_field(what, lo, width, val)
+        # The value is already unpacked
+        obj = what.__new__(what)
+        Octets.__init__(obj, self.tree, lo, width=width)
+        obj.val = val
+        return obj
+
+    def bulk_values(self, what, lo, count, width, fmt):
+        if fmt is None:
+            return None
+        octets = self.layout_octets(lo, lo + count * width)
+        if octets is None:
+            return None
+        vals = array.array(fmt.lstrip("<>"), bytes(octets))
+        if vals.itemsize != width:
+            return None
+        if width > 1 and (fmt[0] == ">") != (sys.byteorder == "big"):
+            vals.byteswap()
+        return vals
+
     def addfield(self, name, what):
         return self.add_field(name, what)
 
@@ -621,3 +766,79 @@ class OctetView(bintree.BinTree):
         with self.this.add_utf8_interpretation(title, more=more) as file:
             for line in self.render(**kwargs):
                 file.write(line + '\n')
+
+class _DictLeaf():
+    ''' The previous layout, for leaf_memory(), all attributes in the instance dict '''
+
+    def __init__(self, attrs):
+        for name, val in attrs:
+            setattr(self, name, val)
+
+def leaf_memory(filename, count=10**4):
+    '''
+       Bytes per leaf, including the values, of `count` leaves of
+       each class, spread over the octets of an image.
+    '''
+
+    import tracemalloc
+    from . import artifact
+    from . import bitstring
+    from . import bitview
+    from . import type_case
+
+    with open(filename, "rb") as file:
+        octets = file.read()
+    this = artifact.ArtifactStream(octets)
+    this.type_case = type_case.Ascii()
+    tree = OctetView(this)
+    bits = bitview.BitView(bits=bitstring.BitString(octets))
+
+    common = ("lo", "hi", "tree", "this", "width", "maxlines", "line_length")
+    limit = len(octets)
+    kinds = [
+        (Octet, 1, limit, lambda lo: Octet(tree, lo), common + ("val",)),
+        (Le16, 2, limit, lambda lo: Le16(tree, lo), common + ("val",)),
+        (Le32, 4, limit, lambda lo: Le32(tree, lo), common + ("val",)),
+        (Be32, 4, limit, lambda lo: Be32(tree, lo), common + ("val",)),
+        (Le64, 8, limit, lambda lo: Le64(tree, lo), common + ("val",)),
+        (HexOctets, 16, limit, lambda lo: HexOctets(tree, lo, width=16), common),
+        (Text(8), 8, limit, lambda lo: Text(8)(tree, lo), common + ("type_case", "txt")),
+        (
+            bitview.Bits, 5, limit * 8,
+            lambda lo: bitview.Bits(bits, lo, width=5),
+            ("tree", "lo", "hi"),
+        ),
+        (
+            bitview.Number, 32, limit * 8,
+            lambda lo: bitview.Number(bits, lo, width=32),
+            ("tree", "lo", "hi", "val"),
+        ),
+    ]
+
+    def measure(make, width, limit):
+        tracemalloc.start()
+        leaves = [make((i * width) % (limit - width)) for i in range(count)]
+        size = tracemalloc.get_traced_memory()[0] - sys.getsizeof(leaves)
+        tracemalloc.stop()
+        return size / count
+
+    def previously(make, attrs, old):
+        def make_old(lo):
+            leaf = make(lo)
+            return old([(x, getattr(leaf, x, None)) for x in attrs])
+        return make_old
+
+    print("%-10s %10s %10s" % ("leaf", "slots", "dict"))
+    for cls, width, limit, make, attrs in kinds:
+        old = type(cls.__name__, (_DictLeaf,), {})
+        print(
+            "%-10s %10.1f %10.1f" % (
+                cls.__name__[:10],
+                measure(make, width, limit),
+                measure(previously(make, attrs, old), width, limit),
+            ),
+            flush=True,
+        )
+
+if __name__ == "__main__":
+    leaf_memory(sys.argv[1])
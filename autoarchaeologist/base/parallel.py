@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+    AutoArchaeologist Parallel Examination
+    --------------------------------------
+
+    With `Excavation(jobs=N)` the artifacts on the queue when the
+    examination starts, (usually the top-level artifacts) are each
+    examined in a forked worker process, at most N at a time.
+
+    Each worker examines its artifact and everything derived from it
+    exactly as a serial run would, and then pickles its `Findings`.
+
+    When all workers are done, the findings are merged back into
+    the excavation in queue order, so the result does not depend
+    on which worker finished first.  Artifacts which were found by
+    more than one worker are only taken from the first, later
+    workers only contribute the linkage (parents, names, notes…)
+    just like `Artifact.create()` does for duplicates in a serial run.
+
+    The content of derived artifacts travels via `.back` files
+    in the html_dir, unless it is a slice of the parent artifact.
+
+    If a worker fails, or if its findings cannot be pickled, the
+    artifact is examined serially instead, in its place in the merge
+    order, before the findings of the workers after it are merged.
+
+    Workers share the excavation's `get_unique()` numbering, their
+    temporary files are kept apart by a per-worker tag in the filename.
+
+    Workers also save their findings in the findings cache, if enabled,
+    and their examiner profile and take-rates are added to those of
+    the excavation.
+'''
+
+import os
+import sys
+import pickle
+import traceback
+
+from . import findings
+from . import profiling
+
+class Worker():
+    ''' Examine one artifact in a forked process '''
+
+    def __init__(self, top, number, this):
+        self.top = top
+        self.number = number
+        self.this = this
+        self.findings = top.filename_for(top, suf=".findings", temp=True)
+        self.profile = top.filename_for(top, suf=".profile", temp=True)
+        self.pid = None
+        self.status = None
+
+    def start(self):
+        ''' Fork the worker process '''
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.pid = os.fork()
+        if self.pid:
+            return
+        status = 1
+        try:
+            self.examine()
+            status = 0
+        except Exception:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Do not run finalizers, they would remove the temporary
+            # files which the interpretations refer to.
+            os._exit(status)
+
+    def examine(self):
+        ''' (Child) Do the examination and save the findings '''
+        self.top.temp_tag = ".w%d" % self.number
+        self.top.profiler = profiling.Profiler()
+        if self.top.adaptive:
+            self.top.adaptive.current = {}
+        fnd = findings.Findings(self.top, self.this)
+        fnd.examine()
+        with open(self.findings.filename, "wb") as file:
+            fnd.dump(file)
+        if self.top.findings_cache:
+            self.top.findings_cache.save(fnd)
+        with open(self.profile.filename, "wb") as file:
+            pickle.dump(self.top.profiler, file)
+            if self.top.adaptive:
+                pickle.dump(self.top.adaptive.current, file)
+
+    def merge(self):
+        ''' Merge the findings into the excavation, return success '''
+        if self.status != 0:
+            print(self.this, "Parallel examination failed (status 0x%x)" % self.status)
+            return False
+        try:
+            with open(self.findings.filename, "rb") as file:
+                findings.Merger(self.top, self.this, file).merge()
+            with open(self.profile.filename, "rb") as file:
+                self.top.profiler.merge(pickle.load(file))
+                if self.top.adaptive:
+                    self.top.adaptive.merge(pickle.load(file))
+        except Exception as err:
+            print(self.this, "Parallel examination findings failed to load", err)
+            return False
+        return True
+
+def examine(top):
+    '''
+       Examine the queued artifacts in parallel
+
+       Artifacts which could not be examined in parallel are
+       examined serially where they would have been merged.
+    '''
+
+    workers = [Worker(top, n, this) for n, this in enumerate(top.queue.drain())]
+
+    running = {}
+    pending = list(workers)
+    while pending or running:
+        while pending and len(running) < top.jobs:
+            worker = pending.pop(0)
+            worker.start()
+            running[worker.pid] = worker
+        pid, status = os.waitpid(-1, 0)
+        worker = running.pop(pid, None)
+        if worker:
+            worker.status = status
+
+    for worker in workers:
+        if not worker.merge():
+            print(worker.this, "Examining serially instead")
+            findings.Findings(top, worker.this).examine()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+    AutoArchaeologist Examiner Profiling
+    ------------------------------------
+
+    Account for where the time goes, per examiner:  How many times
+    it was called, how many times it hit (took the artifact or
+    created children), the total and maximum wall time, the number
+    of octets examined and the slowest individual artifacts.
+
+    Artifacts which were not examined by the expensive tiers of
+    examiners, because the time budget ran out, and examiners which
+    the watchdog abandoned, are also listed.
+
+    With `Excavation(profile=True)` the profile is written as
+    `profile.json` and `profile.html` in the html_dir, the latter
+    is linked from the front page.  The timings differ from run to
+    run, so it is not written by default.
+'''
+
+import time
+import json
+import heapq
+import html
+
+class ExaminerProfile():
+    ''' Profile of one examiner '''
+
+    # How many of the slowest artifacts to remember
+    SLOWEST = 10
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.hits = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        self.octets = 0
+        self.slowest = []	# heap of (time, digest)
+
+    def record(self, this, elapsed, hit):
+        ''' Account for one call '''
+        self.calls += 1
+        if hit:
+            self.hits += 1
+        self.time += elapsed
+        self.octets += len(this)
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        if len(self.slowest) < self.SLOWEST:
+            heapq.heappush(self.slowest, (elapsed, this.digest))
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (elapsed, this.digest))
+
+    def merge(self, other):
+        ''' Add in the profile from another process '''
+        self.calls += other.calls
+        self.hits += other.hits
+        self.time += other.time
+        self.max_time = max(self.max_time, other.max_time)
+        self.octets += other.octets
+        for i in other.slowest:
+            if len(self.slowest) < self.SLOWEST:
+                heapq.heappush(self.slowest, i)
+            elif i > self.slowest[0]:
+                heapq.heapreplace(self.slowest, i)
+
+    def iter_slowest(self):
+        ''' Slowest first '''
+        yield from sorted(self.slowest, reverse=True)
+
+    def json(self):
+        ''' As a JSON friendly dict '''
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "time": self.time,
+            "max_time": self.max_time,
+            "octets": self.octets,
+            "slowest": [
+                {"digest": digest, "time": elapsed}
+                for elapsed, digest in self.iter_slowest()
+            ],
+        }
+
+class Profiler():
+    ''' Per-excavation examiner profile '''
+
+    def __init__(self):
+        self.examiners = {}
+        self.skipped = []	# (digest, tier)
+        self.abandoned = []	# (examiner name, digest, why)
+
+    def profile(self, examiner):
+        ''' The profile of an examiner '''
+        name = examiner.__module__ + "." + examiner.__qualname__
+        retval = self.examiners.get(name)
+        if retval is None:
+            retval = ExaminerProfile(name)
+            self.examiners[name] = retval
+        return retval
+
+    def call(self, examiner, this, watchdog=None):
+        ''' Call an examiner and account for it, return the time it took '''
+        children = len(this.children)
+        t0 = time.perf_counter()
+        try:
+            if watchdog:
+                watchdog.call(examiner, this)
+            else:
+                examiner(this)
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.profile(examiner).record(
+                this,
+                elapsed,
+                this.taken or len(this.children) > children,
+            )
+        return elapsed
+
+    def skip(self, this, tier):
+        ''' Account for an artifact not examined by a tier (and above) '''
+        self.skipped.append((this.digest, tier))
+
+    def abandon(self, examiner, this, why):
+        ''' Account for an examiner abandoned by the watchdog '''
+        self.abandoned.append((self.profile(examiner).name, this.digest, why))
+
+    def merge(self, other):
+        ''' Add in the profile from another process '''
+        for name, prof in other.examiners.items():
+            mine = self.examiners.get(name)
+            if mine is None:
+                self.examiners[name] = prof
+            else:
+                mine.merge(prof)
+        self.skipped += other.skipped
+        self.abandoned += other.abandoned
+
+    def iter_profiles(self):
+        ''' Most time consuming first '''
+        yield from sorted(self.examiners.values(), key=lambda x: -x.time)
+
+    def json(self):
+        ''' As a JSON friendly dict '''
+        return {
+            "examiners": {x.name: x.json() for x in self.iter_profiles()},
+            "skipped": [
+                {"digest": digest, "tier": tier}
+                for digest, tier in self.skipped
+            ],
+            "abandoned": [
+                {"examiner": name, "digest": digest, "why": why}
+                for name, digest, why in self.abandoned
+            ],
+        }
+
+    def produce(self, top):
+        ''' Write profile.json and profile.html, return relpath of the latter '''
+        with open(top.filename_for("profile", suf=".json").filename, "w") as file:
+            json.dump(self.json(), file, indent=4)
+            file.write("\n")
+
+        relpath = top.basename_for("profile")
+        with top.decorator.html_file(relpath, "Examiner Profile") as file:
+            file.write("<pre>")
+            file.link_to(top.basename_for(top), "top")
+            file.write(" - ")
+            file.link_to(top.basename_for("profile", suf=".json"), "json")
+            file.write("</pre>\n")
+            file.write("<H2>Examiner Profile</H2>\n")
+            file.write("<table>\n")
+            file.write("<thead>\n")
+            file.write("<tr>\n")
+            for i in ("Examiner", "Calls", "Hits", "Seconds", "Max", "Octets", "Slowest"):
+                file.write("<th>" + i + "</th>\n")
+            file.write("</tr>\n")
+            file.write("</thead>\n")
+            for n, prof in enumerate(self.iter_profiles()):
+                if n & 1:
+                    file.write('<tr class="stripe">\n')
+                else:
+                    file.write('<tr>\n')
+                file.write("<td>" + html.escape(prof.name) + "</td>")
+                file.write('<td align="right">%d</td>' % prof.calls)
+                file.write('<td align="right">%d</td>' % prof.hits)
+                file.write('<td align="right">%.3f</td>' % prof.time)
+                file.write('<td align="right">%.3f</td>' % prof.max_time)
+                file.write('<td align="right">%d</td>' % prof.octets)
+                file.write("<td>")
+                for elapsed, digest in prof.iter_slowest():
+                    that = top.hashes.get(digest)
+                    if that:
+                        file.link_to_that(that)
+                    else:
+                        file.write(digest[:top.digest_prefix])
+                    file.write(" %.3f " % elapsed)
+                file.write("</td>\n")
+                file.write("</tr>\n")
+            file.write("</table>\n")
+            if self.abandoned:
+                self.produce_abandoned(top, file)
+            if self.skipped:
+                self.produce_skipped(top, file)
+        return relpath
+
+    def produce_abandoned(self, top, file):
+        ''' List the examiners abandoned by the watchdog '''
+        file.write("<H2>Abandoned by the watchdog</H2>\n")
+        file.write("<table>\n")
+        file.write("<thead>\n")
+        file.write("<tr>\n")
+        file.write("<th>Examiner</th>\n")
+        file.write("<th>Why</th>\n")
+        file.write("<th>Artifact</th>\n")
+        file.write("</tr>\n")
+        file.write("</thead>\n")
+        for name, digest, why in self.abandoned:
+            file.write("<tr><td>" + html.escape(name) + "</td>")
+            file.write("<td>" + why + "</td><td>")
+            that = top.hashes.get(digest)
+            if that:
+                file.link_to_that(that)
+            else:
+                file.write(digest[:top.digest_prefix])
+            file.write("</td></tr>\n")
+        file.write("</table>\n")
+
+    def produce_skipped(self, top, file):
+        ''' List the artifacts skipped for lack of time '''
+        file.write("<H2>Skipped for lack of time</H2>\n")
+        file.write("<table>\n")
+        file.write("<thead>\n")
+        file.write("<tr>\n")
+        file.write("<th>Tier</th>\n")
+        file.write("<th>Artifact</th>\n")
+        file.write("</tr>\n")
+        file.write("</thead>\n")
+        for digest, tier in self.skipped:
+            file.write('<tr><td align="right">%d</td><td>' % tier)
+            that = top.hashes.get(digest)
+            if that:
+                file.link_to_that(that)
+                file.write(" " + that.summary(names=True, notes=True))
+            else:
+                file.write(digest[:top.digest_prefix])
+            file.write("</td></tr>\n")
+        file.write("</table>\n")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+    AutoArchaeologist Artifact Residency
+    ------------------------------------
+
+    Artifacts created from octets, rather than as slices of their
+    parents, hold those octets in RAM for the life of the excavation,
+    and so do fragmented artifacts, for fragments which are not slices.
+
+    With `Excavation(spill_threshold=…)` such artifacts of at least
+    that many octets are written to their `.back` file in the
+    html_dir when they are adopted, and the file is mapped instead.
+    The files are removed with the excavation, see
+    `Excavation.backing_for()`.
+
+    With `Excavation(resident_budget=…)` the mapped files of the
+    artifacts examined most recently are allowed that many octets,
+    when the total is exceeded, the pages of the least recently
+    examined mappings are released with `madvise(MADV_DONTNEED)`.
+    The mappings stay valid, the kernel reads the pages back from
+    the file, if they are needed again.
+
+    All mappings are shared and read-only, which is what makes it
+    safe to release their pages.
+'''
+
+import os
+import mmap
+import collections
+
+from . import scheduler
+
+def mapping_of(this):
+    ''' The mmap holding the octets of an artifact, if any '''
+    octets = this.__dict__.get("bdx")
+    if octets is None:
+        octets = this.__dict__.get("_map")
+    if isinstance(octets, memoryview) and isinstance(octets.obj, mmap.mmap):
+        return octets.obj
+    return None
+
+class Residency():
+    ''' Spill artifacts to mapped files, and keep the mappings within a budget '''
+
+    def __init__(self, top, threshold=None, budget=None):
+        self.top = top
+        self.threshold = threshold
+        self.budget = budget
+        self.maps = collections.OrderedDict()	# id -> mmap, LRU first
+        self.resident = 0
+        self.spilled = 0
+
+    def adopt(self, this):
+        ''' Spill a new artifact, if it is large and held in RAM '''
+        if self.threshold is None:
+            return
+        if scheduler.resident_octets(this) >= self.threshold:
+            self.spill(this)
+
+    def spill(self, this):
+        ''' Write the octets of an artifact to its backing file and map that '''
+        if this.__dict__.get("bdx") is None:
+            # ArtifactFragmented: its backing file becomes the .back file
+            this.materialize()
+            self.spilled += len(this)
+            return
+        backing = self.top.backing_for(this)
+        if not os.path.exists(backing.filename) or os.path.getsize(backing.filename) != len(this):
+            tmpname = backing.filename + ".tmp.%d" % os.getpid()
+            with open(tmpname, "wb") as file:
+                this.writetofile(file)
+            os.rename(tmpname, backing.filename)
+        with open(backing.filename, "rb") as file:
+            this.bdx = memoryview(
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            ).toreadonly()
+        self.spilled += len(this)
+
+    def touch(self, this):
+        ''' An artifact is being examined, release the LRU mappings if over budget '''
+        if self.budget is None:
+            return
+        mapping = mapping_of(this)
+        if mapping is None or mapping.closed:
+            return
+        key = id(mapping)
+        if key in self.maps:
+            self.maps.move_to_end(key)
+            return
+        self.maps[key] = mapping
+        self.resident += len(mapping)
+        while self.resident > self.budget and len(self.maps) > 1:
+            _key, old = self.maps.popitem(last=False)
+            self.resident -= len(old)
+            if not old.closed:
+                old.madvise(mmap.MADV_DONTNEED)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+    AutoArchaeologist Queue Schedulers
+    ----------------------------------
+
+    The order in which queued artifacts are examined is decided
+    by the scheduler given to `Excavation(scheduler=…)`, which is
+    called with the excavation to create the queue:
+
+    `FifoQueue` (the default) examines artifacts in the order they
+    were created, that is breadth-first.
+
+    `DepthFirstQueue` examines the children of an artifact before
+    its siblings, so a tape with many files does not materialize
+    all of them before any is examined.
+
+    `SmallestFirstQueue` examines the smallest artifacts first.
+
+    `MemoryBudgetQueue` is breadth-first, but while the octets held
+    in RAM by queued artifacts exceed a budget, the large ones are
+    spilled to their `.back` files, (see residency.py), until the
+    budget is met, so they hold no RAM until they are examined:
+
+        Excavation(
+            scheduler=functools.partial(
+                scheduler.MemoryBudgetQueue,
+                budget=4<<30,
+            ),
+        )
+
+    All schedulers report the queue depth and the octets held in
+    RAM by the queued artifacts every `REPORT_INTERVAL` seconds while running.
+
+    Artifacts deferred to more expensive examiner tiers are kept
+    in the queue, in the order they were deferred, until the queue
+    is otherwise empty, cheapest tier first.
+'''
+
+import time
+import heapq
+import mmap
+import collections
+
+def resident_octets(this):
+    ''' The octets an artifact holds in RAM by itself '''
+    octets = this.__dict__.get("bdx")
+    if octets is None:
+        octets = this.__dict__.get("_map")
+    if octets is None and "_frags" in this.__dict__:
+        # The private copies of an ArtifactFragmented's fragments
+        return sum(private_octets(rec.frag) for rec in this._frags)
+    return private_octets(octets)
+
+def private_octets(octets):
+    ''' The octets held in RAM by a buffer of its own '''
+    if not isinstance(octets, memoryview):
+        return 0
+    obj = octets.obj
+    if isinstance(obj, mmap.mmap):
+        return 0
+    if isinstance(obj, (bytes, bytearray)) and len(obj) != octets.nbytes:
+        # A slice of something else
+        return 0
+    return octets.nbytes
+
+class FifoQueue():
+    ''' Breadth-first, the order the artifacts were created '''
+
+    # Seconds between progress reports, None to disable
+    REPORT_INTERVAL = 60
+
+    def __init__(self, top):
+        self.top = top
+        self.resident = 0
+        self.charged = {}	# id -> resident octets, when queued
+        self.max_depth = 0
+        self.max_resident = 0
+        self.last_report = time.time()
+        self.queue = collections.deque()
+        self.tiers = {}
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __iter__(self):
+        yield from self.queue
+
+    def append(self, this):
+        ''' Queue an artifact '''
+        octets = resident_octets(this)
+        if octets:
+            self.charged[id(this)] = octets
+            self.resident += octets
+        self.max_resident = max(self.max_resident, self.resident)
+        self.put(this)
+        self.max_depth = max(self.max_depth, len(self))
+
+    def put(self, this):
+        ''' Put an artifact on the queue '''
+        self.queue.append(this)
+
+    def pop(self):
+        ''' The next artifact to examine '''
+        if self.REPORT_INTERVAL is not None:
+            now = time.time()
+            if now - self.last_report >= self.REPORT_INTERVAL:
+                self.last_report = now
+                self.report()
+        this = self.take()
+        self.release(this)
+        return this
+
+    def release(self, this):
+        ''' An artifact leaves the queue '''
+        self.resident -= self.charged.pop(id(this), 0)
+
+    def take(self):
+        ''' Take the next artifact off the queue '''
+        return self.queue.popleft()
+
+    def defer(self, this, tier):
+        ''' Defer an artifact to an examiner tier '''
+        self.tiers.setdefault(tier, collections.deque()).append(this)
+
+    def pop_deferred(self):
+        ''' Return (tier, artifact) from the cheapest tier, or None '''
+        for tier in sorted(self.tiers):
+            deferred = self.tiers[tier]
+            if deferred:
+                return tier, deferred.popleft()
+            del self.tiers[tier]
+        return None
+
+    def drain(self):
+        ''' Empty the queue, return its content in order '''
+        retval = list(self)
+        for this in retval:
+            self.release(this)
+        self.queue.clear()
+        return retval
+
+    def report(self):
+        ''' Report progress '''
+        print(
+            "Queue: %d artifacts (max %d), resident %d octets (max %d)" % (
+                len(self), self.max_depth, self.resident, self.max_resident
+            )
+        )
+
+class DepthFirstQueue(FifoQueue):
+    ''' Children before siblings, siblings in the order created '''
+
+    def __init__(self, top):
+        super().__init__(top)
+        self.stack = []
+
+    def __len__(self):
+        return len(self.queue) + len(self.stack)
+
+    def __iter__(self):
+        # Same order as take()
+        yield from self.queue
+        yield from reversed(self.stack)
+
+    def take(self):
+        if self.queue:
+            # Created since last pop, go there first
+            self.stack.extend(reversed(self.queue))
+            self.queue.clear()
+        return self.stack.pop()
+
+    def drain(self):
+        retval = super().drain()
+        self.stack.clear()
+        return retval
+
+class SmallestFirstQueue(FifoQueue):
+    ''' Smallest artifacts first, ties in the order created '''
+
+    def __init__(self, top):
+        super().__init__(top)
+        self.queue = []
+        self.serial = 0
+
+    def __iter__(self):
+        for _length, _serial, this in sorted(self.queue):
+            yield this
+
+    def put(self, this):
+        self.serial += 1
+        heapq.heappush(self.queue, (len(this), self.serial, this))
+
+    def take(self):
+        return heapq.heappop(self.queue)[-1]
+
+class MemoryBudgetQueue(FifoQueue):
+    '''
+       Breadth-first, but artifacts larger than `large` are spilled,
+       last queued first, while the resident octets exceed `budget`
+    '''
+
+    def __init__(self, top, budget=2<<30, large=None):
+        super().__init__(top)
+        self.budget = budget
+        if large is None:
+            large = budget >> 6
+        self.large = large
+        self.n_spilled = 0
+        self.octets_spilled = 0
+
+    def take(self):
+        if self.resident > self.budget:
+            self.spill()
+        return super().take()
+
+    def spill(self):
+        ''' Spill large queued artifacts until the budget is met '''
+        for this in reversed(self.queue):
+            if self.resident <= self.budget:
+                break
+            charged = self.charged.get(id(this), 0)
+            if charged < self.large:
+                continue
+            self.top.residency.spill(this)
+            self.release(this)
+            octets = resident_octets(this)
+            if octets:
+                self.charged[id(this)] = octets
+                self.resident += octets
+            self.n_spilled += 1
+            self.octets_spilled += charged - octets
+
+    def report(self):
+        super().report()
+        print(
+            "Queue: %d large artifacts spilled (%d octets)" % (
+                self.n_spilled, self.octets_spilled
+            )
+        )
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+   Unread and uniformly filled sectors
+   -----------------------------------
+
+   By convention, octets which were not read from the original
+   media are filled with b'_UNREAD_' repeatedly.
+
+   A `SectorMap` scans a buffer once for runs of that pattern, and
+   optionally for sectors filled with a single octet value, and
+   keeps a flag-octet per sector, so that record definitions, disk
+   sectors and disk pictures can consult it, rather than comparing
+   the octets of each sector again.
+
+   Like `artifact.Unread`, a sector is unread if it matches the
+   start of the repeated pattern, so an empty sector is unread.
+
+   Run this file to test it against brute force.
+'''
+
+import re
+import bisect
+import random
+import operator
+import itertools
+
+UNREAD = b'_UNREAD_'
+
+UNREAD_RUNS = re.compile(b'(?:' + re.escape(UNREAD) + b')+')
+
+UNIFORM_RUN = re.compile(b'(.)\\1*', re.DOTALL)
+
+class SectorMap():
+    ''' Flags for the sectors [los[n]:his[n]] of a buffer '''
+
+    UNREAD = 1
+    UNIFORM = 2
+
+    def __init__(self, octets, los, his, uniform=True):
+        self.los = los
+        self.his = his
+        self.rows = None
+        self.pattern = UNREAD
+        self.flags = bytearray(len(los))
+        self.scan_unread(octets)
+        if uniform:
+            self.scan_uniform(octets)
+
+    def __len__(self):
+        return len(self.flags)
+
+    def __getitem__(self, row):
+        return self.flags[row]
+
+    def sorted_rows(self):
+        ''' Rows in order of lo '''
+        los = self.los
+        if all(map(operator.le, los, itertools.islice(los, 1, None))):
+            return range(len(los))
+        return sorted(range(len(los)), key=los.__getitem__)
+
+    def scan_unread(self, octets):
+        '''
+           Find the runs of UNREAD, and the sectors starting in them.
+
+           A run found by the regex may start out of step with a
+           sector, and even swallow the start of it, so sectors not
+           in step with the run are compared in full.
+        '''
+        rows = self.sorted_rows()
+        starts = [self.los[x] for x in rows]
+        for row, lo, hi in zip(range(len(self.flags)), self.los, self.his):
+            # Too short to contain a run
+            if hi - lo < len(UNREAD) and octets[lo:hi] == UNREAD[:hi - lo]:
+                self.flags[row] |= self.UNREAD
+        for match in UNREAD_RUNS.finditer(octets):
+            first, last = match.span()
+            i = bisect.bisect_left(starts, first)
+            while i < len(starts) and starts[i] < last:
+                row = rows[i]
+                lo = self.los[row]
+                hi = self.his[row]
+                i += 1
+                if hi - lo < len(UNREAD):
+                    continue
+                if (lo - first) % len(UNREAD) == 0 and hi <= last:
+                    self.flags[row] |= self.UNREAD
+                elif octets[lo:hi] == self.unread_pattern(hi - lo):
+                    self.flags[row] |= self.UNREAD
+
+    def unread_pattern(self, length):
+        ''' UNREAD repeated to length octets '''
+        if len(self.pattern) < length:
+            self.pattern = UNREAD * (1 + length // len(UNREAD))
+        return self.pattern[:length]
+
+    def scan_uniform(self, octets):
+        ''' Find the sectors filled with a single octet value '''
+        for row, lo, hi in zip(range(len(self.flags)), self.los, self.his):
+            if hi > lo and UNIFORM_RUN.match(octets, lo, hi).end() == hi:
+                self.flags[row] |= self.UNIFORM
+
+    def at(self, lo, hi):
+        ''' The flags of the sector [lo:hi], None if it is not in the map '''
+        if self.rows is None:
+            self.rows = dict(zip(self.los, range(len(self.los))))
+        row = self.rows.get(lo)
+        if row is None or self.his[row] != hi:
+            return None
+        return self.flags[row]
+
+    def is_unread(self, row):
+        ''' Does the sector in row contain UNREAD only ? '''
+        return bool(self.flags[row] & self.UNREAD)
+
+    def is_uniform(self, row):
+        ''' Is the sector in row filled with a single octet value ? '''
+        return bool(self.flags[row] & self.UNIFORM)
+
+def test_sectormap():
+    ''' Compare against brute force, on fragments of UNREAD '''
+
+    rnd = random.Random(18)
+    pieces = [UNREAD, UNREAD, UNREAD[:3], UNREAD[3:], UNREAD[1:], b'_', b'x', bytes(8)]
+    for _i in range(3000):
+        octets = b''.join(rnd.choice(pieces) for _j in range(rnd.randrange(1, 20)))
+        los = []
+        his = []
+        lo = rnd.randrange(4)
+        while lo < len(octets):
+            hi = min(len(octets), lo + rnd.choice((0, 3, 8, 8, 16, 24, 11)))
+            los.append(lo)
+            his.append(hi)
+            lo = max(hi, lo + 1)
+        smap = SectorMap(octets, los, his)
+        for row, (lo, hi) in enumerate(zip(los, his)):
+            expect = octets[lo:hi] == (UNREAD * (1 + (hi - lo) // 8))[:hi - lo]
+            assert smap.is_unread(row) == expect, (octets, lo, hi)
+            expect = hi > lo and octets[lo:hi] == octets[lo:lo + 1] * (hi - lo)
+            assert smap.is_uniform(row) == expect, (octets, lo, hi)
+    print("SectorMap OK")
+
+if __name__ == "__main__":
+    test_sectormap()
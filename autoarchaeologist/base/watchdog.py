@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+    AutoArchaeologist Examiner Watchdog
+    -----------------------------------
+
+    With `Excavation(examiner_cpu_limit=…, examiner_memory_limit=…)`,
+    or with `CPU_LIMIT` and `MEMORY_LIMIT` class attributes on the
+    examiners themselves, examiners run under supervision:
+
+    The CPU limit (in seconds) is enforced with an interval timer,
+    which raises `ExaminerTimeout` in the examiner.  It is derived
+    from `BaseException` so that `except Exception:` in examiners
+    does not catch it, and the timer keeps firing until the
+    examiner gives up.
+
+    The memory limit (in octets) is enforced by limiting the address
+    space of the process to what it was, plus the limit, during the
+    call, which makes allocations fail with `MemoryError`, or with
+    `OSError(ENOMEM)` where they map memory directly.
+
+    An examiner which exceeds its limits is abandoned for that
+    artifact (whatever it did until then stays), the artifact gets
+    a note `ExaminerTimeout(<class>)` or `ExaminerMemory(<class>)`,
+    the case is listed in the profile, and the excavation continues.
+'''
+
+import errno
+import signal
+import resource
+
+class ExaminerTimeout(BaseException):
+    ''' An examiner ran out of CPU time '''
+
+def address_space():
+    ''' The current size of the address space of the process '''
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[0]) * resource.getpagesize()
+
+class Watchdog():
+    ''' Run examiners under CPU and memory limits '''
+
+    # Seconds between repeated timeouts, if the examiner catches them
+    REPEAT = 1.0
+
+    def __init__(self, top, cpu_limit=None, memory_limit=None):
+        self.top = top
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+        self.armed = False
+
+    def limits(self, examiner):
+        ''' The (cpu, memory) limits for an examiner '''
+        return (
+            getattr(examiner, "CPU_LIMIT", self.cpu_limit),
+            getattr(examiner, "MEMORY_LIMIT", self.memory_limit),
+        )
+
+    def call(self, examiner, this):
+        ''' Call an examiner under supervision '''
+        cpu_limit, memory_limit = self.limits(examiner)
+        if cpu_limit is None and memory_limit is None:
+            examiner(this)
+            return
+
+        old_handler = None
+        installed = False
+        old_rlimit = None
+        try:
+            if cpu_limit is not None:
+                old_handler = signal.signal(signal.SIGPROF, self.timeout)
+                installed = True
+                self.armed = True
+                signal.setitimer(signal.ITIMER_PROF, cpu_limit, self.REPEAT)
+            if memory_limit is not None:
+                old_rlimit = resource.getrlimit(resource.RLIMIT_AS)
+                limit = address_space() + memory_limit
+                if old_rlimit[1] != resource.RLIM_INFINITY:
+                    limit = min(limit, old_rlimit[1])
+                resource.setrlimit(resource.RLIMIT_AS, (limit, old_rlimit[1]))
+            try:
+                examiner(this)
+            finally:
+                # A timeout until here is caught below, none after
+                self.armed = False
+        except ExaminerTimeout:
+            self.abandon(examiner, this, "ExaminerTimeout")
+        except MemoryError:
+            self.abandon(examiner, this, "ExaminerMemory")
+        except OSError as err:
+            # mmap(2) & co fail with ENOMEM under RLIMIT_AS
+            if old_rlimit is None or err.errno != errno.ENOMEM:
+                raise
+            self.abandon(examiner, this, "ExaminerMemory")
+        finally:
+            self.armed = False
+            if cpu_limit is not None:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+            if installed:
+                # None if the old handler was not installed from Python
+                if old_handler is None:
+                    old_handler = signal.SIG_DFL
+                signal.signal(signal.SIGPROF, old_handler)
+            if old_rlimit is not None:
+                resource.setrlimit(resource.RLIMIT_AS, old_rlimit)
+
+    def timeout(self, _signo, _frame):
+        ''' Signal handler '''
+        if self.armed:
+            raise ExaminerTimeout()
+
+    def abandon(self, examiner, this, why):
+        ''' Record an examiner which ran out of resources '''
+        this.add_note(why + "(" + examiner.__name__ + ")")
+        self.top.profiler.abandon(examiner, this, why)
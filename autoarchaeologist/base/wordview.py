@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# See LICENSE file for full text of license
+
+'''
+   Artifacts as arrays of words
+   ----------------------------
+
+   `Artifact.words(width, endian)` returns a `WordView` of the
+   artifact, or a slice of it, as 16, 32 or 64 bit unsigned words.
+
+   When the endianness is the same as the machine we run on, the
+   view is a cast of the octets, otherwise it is a byte-swapped
+   copy, which the artifact caches.
+
+   The bulk helpers run at C speed:
+
+       wv = this.words(16, "little")
+       if wv.checksum():
+           return
+       ptr = wv.find(0xffff)
+
+   For machines with other word sizes, `unpack()` and `pack()` convert
+   between octets and words of any width up to 64 bits, with the bits
+   taken MSB or LSB first:
+
+       clusters = wordview.unpack(octets, 12, lsb_first=True)
+'''
+
+import re
+import sys
+import math
+import array
+import collections
+
+FORMATS = {
+    16: 'H',
+    32: 'I',
+    64: 'Q',
+}
+
+def swapped_octets(octets, width):
+    ''' Byte-swap words of `width` bits '''
+    arr = array.array(FORMATS[width], bytes(octets))
+    arr.byteswap()
+    return memoryview(arr).cast('B').toreadonly()
+
+class WordView():
+    ''' Words of `width` bits, from octets in the machine's byte order '''
+
+    def __init__(self, octets, width=16, endian="big"):
+        self.width = width
+        self.endian = endian
+        self.octets = octets
+        self.view = octets.cast(FORMATS[width])
+
+    def __len__(self):
+        return len(self.view)
+
+    def __getitem__(self, idx):
+        return self.view[idx]
+
+    def __iter__(self):
+        yield from self.view
+
+    def tolist(self):
+        ''' As a list of integers '''
+        return self.view.tolist()
+
+    def tobytes(self, endian=None):
+        ''' As octets, by default in the original endianness '''
+        if endian is None:
+            endian = self.endian
+        if endian == sys.byteorder:
+            return self.octets.tobytes()
+        return swapped_octets(self.octets, self.width).tobytes()
+
+    def checksum(self):
+        ''' The sum of the words, modulo 2**width '''
+        return sum(self.view) & ((1 << self.width) - 1)
+
+    def find(self, word, start=0, end=None):
+        ''' Index of the first `word` in [start:end], or -1 '''
+        size = self.width >> 3
+        if end is None:
+            end = len(self)
+        needle = re.compile(re.escape(word.to_bytes(size, sys.byteorder)))
+        pos = start * size
+        while True:
+            hit = needle.search(self.octets, pos, end * size)
+            if hit is None:
+                return -1
+            if not hit.start() % size:
+                return hit.start() // size
+            pos = hit.start() + 1
+
+    def histogram(self):
+        ''' Count of each word value '''
+        return collections.Counter(self.view)
+
+def geometry(width):
+    ''' (octets, words) per group of whole octets and whole words '''
+    assert 0 < width <= 64
+    bits = width * 8 // math.gcd(width, 8)
+    return bits >> 3, bits // width
+
+def unpack(octets, width, lsb_first=False):
+    '''
+       Unpack octets into an array of `width` bit words, an
+       incomplete last word is dropped.
+
+       Each word position in a group is gathered from all groups
+       with slices, into 64 bit containers, which are then shifted
+       and masked.
+    '''
+    group, per_group = geometry(width)
+    nwords = len(octets) * 8 // width
+    ngroups = (nwords + per_group - 1) // per_group
+    data = bytes(octets) + bytes(group * 2)
+    mask = (1 << width) - 1
+    retval = array.array('Q', bytes(8 * ngroups * per_group))
+    if lsb_first:
+        swap = sys.byteorder != "little"
+    else:
+        swap = sys.byteorder != "big"
+    for pos in range(per_group):
+        bit = pos * width
+        first = bit >> 3
+        span = ((bit & 7) + width + 7) >> 3
+        if lsb_first:
+            shift = bit & 7
+        else:
+            shift = span * 8 - (bit & 7) - width
+        if span > 8:
+            # Does not fit a container, take it one word at a time
+            endian = "little" if lsb_first else "big"
+            retval[pos::per_group] = array.array('Q', (
+                (int.from_bytes(data[i:i + span], endian) >> shift) & mask
+                for i in range(first, first + ngroups * group, group)
+            ))
+            continue
+        buf = bytearray(8 * ngroups)
+        for j in range(span):
+            src = data[first + j::group][:ngroups]
+            if lsb_first:
+                buf[j::8] = src
+            else:
+                buf[8 - span + j::8] = src
+        vals = array.array('Q', bytes(buf))
+        if swap:
+            vals.byteswap()
+        if shift or span * 8 != width:
+            vals = array.array('Q', ((x >> shift) & mask for x in vals))
+        retval[pos::per_group] = vals
+    del retval[nwords:]
+    return retval
+
+def pack(words, width, lsb_first=False):
+    ''' Pack `width` bit words into octets, the last octet is zero-padded '''
+    limit = 1 << width
+    for word in words:
+        if not 0 <= word < limit:
+            raise ValueError("Word %d does not fit in %d bits" % (word, width))
+    group, per_group = geometry(width)
+    retval = bytearray()
+    for i in range(0, len(words), per_group):
+        val = 0
+        chunk = list(words[i:i + per_group])
+        chunk += [0] * (per_group - len(chunk))
+        if lsb_first:
+            for j, word in enumerate(chunk):
+                val |= word << (j * width)
+            retval += val.to_bytes(group, "little")
+        else:
+            for word in chunk:
+                val = (val << width) | word
+            retval += val.to_bytes(group, "big")
+    del retval[(len(words) * width + 7) >> 3:]
+    return bytes(retval)
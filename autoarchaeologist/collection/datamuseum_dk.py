@@ -18,7 +18,6 @@ import urllib.request
 import ddhf_bitstore_metadata
 from ddhf_bitstore_metadata.sections import media
 
-from ..base import artifact
 from ..base import excavation
 from ..container import simh_crd_file
 from ..container import simh_tap_file
@@ -343,6 +342,7 @@ class FromBitStore():
         i = getattr(meta.Media, "Type", None)
         if i and i.val:
             this.add_type(i.val)
+            this.media_type = i.val
 
     def impose_geometry(self, meta, this):
         ''' Impose Media.Geometry as records '''
@@ -359,15 +359,6 @@ def impose_bitstore_geometry(this, gspec):
 
     geom = media.ParseGeometry(gspec, tolerant=True)
     try:
-        off = 0
-        for chs, sector_size in geom:
-            this.define_rec(
-                artifact.Record(
-                    low=off,
-                    frag=this[off:off+sector_size],
-                    key=chs,
-                )
-            )
-            off += sector_size
+        this.define_recs(geom)
     except:
         print(this, "Geometry Trouble", geom)
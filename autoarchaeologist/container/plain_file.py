@@ -6,6 +6,7 @@
 
 ''' Create an artifact from a plain file '''
 
+import os
 import mmap
 
 from ..base import artifact
@@ -21,3 +22,4 @@ class PlainFileArtifact(artifact.ArtifactStream):
                 access=mmap.ACCESS_READ,
             )
         super().__init__(self._mmap)
+        self.plain_filename = os.path.abspath(filename)
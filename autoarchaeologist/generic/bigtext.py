@@ -22,6 +22,8 @@
    The (limited set of) glyphs recognized are defined at the very bottom of this file.
 '''
 
+from ..base import dispatch
+
 class Tree():
     ''' A node in the search tree '''
 
@@ -200,12 +202,19 @@ class BigTextBase():
     GIVE_UP_AFTER = 8192	# Bail if nothing found by this much input
     VERBOSE = 0
 
+    # Scans every position
+    TIER = dispatch.EXPENSIVE
+
     TREE = Tree()
 
     def __init__(self, this):
         if this.has_type("BigText"):
             return
 
+        # Hits must have a blank leader, see lead()
+        if this.stats().longest_zero_run < self.MIN_LEADER and this[0]:
+            return
+
         self.this = this
         self.hits = []
 
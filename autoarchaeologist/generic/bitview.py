@@ -46,7 +46,7 @@ class Bits(bintree.BinTreeLeaf):
             yield "1[0x%x]" % len(bits)
             return
         fmt = "(0x%%0%dx)" % ((3 + self.hi - self.lo) >> 2)
-        yield fmt % int(bits, 2) + " " + bits
+        yield fmt % int(bits) + " " + str(bits)
 
 class Ignore(Bits):
     ''' ... '''
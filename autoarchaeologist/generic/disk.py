@@ -12,9 +12,13 @@
    By convention, a sector containing b'_UNREAD_' repeatedly
    is considered invalid because they were not read from the
    original media.
+
+   The unread and uniformly filled sectors are found in a single
+   scan of the artifact, see `base.sectormap`.
 '''
 
 from ..base import octetview as ov
+from ..base import sectormap
 from ..base import category_colors
 from ..toolbox import png
 
@@ -47,7 +51,7 @@ class Sector(ov.Octets):
         self.cyl = cyl
         self.head = head
         self.sect = sect
-        self.is_unread = self.this[self.lo:self.hi] == tree.unread_pattern
+        self.is_unread = tree.is_unread(self.lo, self.hi)
         if self.is_unread and unread_note:
             self.tree.this.add_note(unread_note)
         self.terse = False
@@ -95,8 +99,7 @@ class UnusedSector(Sector):
             unread_note="UNREAD_UNUSED_SECT",
             **kwargs
         )
-        i = set(self.tree.this[self.lo:self.hi])
-        if len(i) == 1:
+        if self.tree.is_uniform(self.lo, self.hi):
             self.fill = " 0x%02x[%d]" % (self.tree.this[self.lo], self.hi - self.lo)
         else:
             self.fill = None
@@ -135,11 +138,37 @@ class Disk(ov.OctetView):
         if physsect is None:
             physsect = 128
         self.physsect = physsect
+        self.sectormap = None
         if unread_pattern is None:
-            unread_pattern = b'_UNREAD_' * (physsect // 8)
+            unread_pattern = sectormap.UNREAD * (physsect // 8)
         self.unread_pattern = unread_pattern
         super().__init__(this, line_length=physsect)
 
+    def sector_flags(self, lo, hi):
+        ''' The sectormap flags of [lo:hi], None if it is not a sector '''
+        if self.sectormap is None:
+            los = list(self.losec)
+            his = [x + self.width[self.losec[x]] for x in los]
+            self.sectormap = sectormap.SectorMap(self.this[:len(self.this)], los, his)
+        return self.sectormap.at(lo, hi)
+
+    def is_unread(self, lo, hi):
+        ''' Does [lo:hi] contain the unread_pattern ? '''
+        flags = self.sector_flags(lo, hi)
+        pattern = self.unread_pattern
+        if flags is None or pattern != sectormap.UNREAD * (len(pattern) // 8):
+            return self.this[lo:hi] == self.unread_pattern
+        if hi - lo != len(self.unread_pattern):
+            return False
+        return bool(flags & sectormap.SectorMap.UNREAD)
+
+    def is_uniform(self, lo, hi):
+        ''' Is [lo:hi] filled with a single octet value ? '''
+        flags = self.sector_flags(lo, hi)
+        if flags is None:
+            return len(set(self.this[lo:hi])) == 1
+        return bool(flags & sectormap.SectorMap.UNIFORM)
+
     def iter_chsb(self):
         ''' Iterate all CHSB '''
         for ncyl, nhd, nsec, nbyte in self.geometry:
@@ -179,6 +208,11 @@ class Disk(ov.OctetView):
 
     def disk_picture(self, file, this):
         ''' Draw a UTF-8-art picture of the disk '''
+        for chs, lo in self.seclo.items():
+            if self.picture[chs] == '?':
+                flags = self.sector_flags(lo, lo + self.width[chs])
+                if flags is not None and flags & sectormap.SectorMap.UNREAD:
+                    self.picture[chs] = 'U'
         for j in self.picture.values():
             if j not in self.picture_legend:
                 self.picture_legend[j] = '?'
@@ -13,6 +13,8 @@ import os
 import sys
 import subprocess
 
+from ..base import dispatch
+
 PYREVENG3 = os.environ.get("AUTOARCHAEOLOGIST_PYREVENG3")
 if not PYREVENG3 or not os.path.isdir(PYREVENG3):
     PYREVENG3 = str(os.environ.get("HOME")) + "/PyReveng3/"
@@ -24,6 +26,9 @@ if not PYREVENG3 or not os.path.isdir(PYREVENG3):
 class PyReveng3():
     ''' ... '''
 
+    # Runs a separate process
+    TIER = dispatch.EXPENSIVE
+
     def __init__(self, this, script):
         if not PYREVENG3:
             return
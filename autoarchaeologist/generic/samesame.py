@@ -11,10 +11,8 @@
 class SameSame():
     ''' Tag artifacts with only a single byte value '''
     def __init__(self, this):
-        i = this[0]
-        for j in this:
-            if i != j:
-                return
+        if this.stats().uniform is None:
+            return
 
         self.this = this
         kind = "0x%02x[0x%x]" % (this[0], len(this))
@@ -8,6 +8,8 @@
    Generic Text files, based on type_case
 '''
 
+from ..base import dispatch
+
 class TextFile():
     ''' General Text-File-Excavator '''
 
@@ -33,6 +35,14 @@ class TextFile():
     # How many lines must there be (= '\n' in output)
     MIN_LINES = 1
 
+    PRECONDITION = dispatch.Precondition(max_length=MAX_LENGTH)
+
+    def __init_subclass__(cls, **kwargs):
+        # Subclasses may change MAX_LENGTH
+        super().__init_subclass__(**kwargs)
+        if "PRECONDITION" not in cls.__dict__:
+            cls.PRECONDITION = dispatch.Precondition(max_length=cls.MAX_LENGTH)
+
     def __init__(self, this):
         if this.children:
             return
@@ -49,6 +59,9 @@ class TextFile():
             # Allow a few more to report what we failed on
             go_quietly_at += 10
 
+        if self.hopeless(this, type_case, go_quietly_at):
+            return
+
         self.tolerance = []
         self.this = this
         self.eof_pos = None
@@ -85,6 +98,27 @@ class TextFile():
             file.write(''.join(self.txt))
         this.add_type(self.__class__.__name__)
 
+    def hopeless(self, this, type_case, go_quietly_at):
+        '''
+           Would we give up on the INVALID octets before the end ?
+
+           Decided on the octet statistics, when there is no EOF
+           octet and the octets are in storage order.
+        '''
+        if this.byte_order is not None:
+            return False
+        eof = []
+        invalid = []
+        for n, slug in enumerate(type_case.slugs):
+            if slug.flags & type_case.EOF:
+                eof.append(n)
+            if slug.flags & type_case.INVALID and not slug.flags & type_case.IGNORE:
+                invalid.append(n)
+        stats = this.stats()
+        if stats.count(eof):
+            return False
+        return stats.count(invalid) > max(self.INVALID_COUNT, go_quietly_at)
+
     def credible(self):
         ''' Determine if result warrants a new artifact '''
         if not self.credible_tolerance():
@@ -188,6 +188,9 @@ class Decorator():
             fo.write("<pre>\n")
             #fo.write(self.html_link_to(self.top, "top"))
             fo.link_to("index.html", "top")
+            if self.top.profile:
+                fo.write(" - ")
+                fo.link_to(self.top.profiler.produce(self.top), "profile")
             fo.write("</pre>\n")
             self.top.index.Index(self.top).produce(fo)
 
@@ -437,9 +437,9 @@ class CpmFileSystem(ov.OctetView):
         file.write("<H3>" + self.name + "</H3>\n")
         file.write("<pre>\n")
         file.write("Media:             ")
-        file.write(str(self.this._key_min))
-        file.write(" … " + str(self.this._key_max))
-        file.write(" " + str(self.this._reclens))
+        file.write(str(self.this._records.key_min))
+        file.write(" … " + str(self.this._records.key_max))
+        file.write(" " + str(self.this._records.reclens))
         file.write("\n")
         file.write("Signature:         " + self.signature + "\n")
         file.write("Confidence score:  +" + str(self.credits) + "/-" + str(self.debits) + " ")
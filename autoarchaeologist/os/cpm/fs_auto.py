@@ -21,6 +21,7 @@
       https://seasip.info/Cpm/formats.html
 '''
 
+from ...base import dispatch
 from ...base import octetview as ov
 from . import common, fs_abc, fs_beastiarium
 
@@ -214,6 +215,9 @@ class ProbeCpmFileSystem(ov.OctetView):
        and determine as many parameters as we can.
     '''
 
+    # Searches geometries and interleaves
+    TIER = dispatch.EXPENSIVE
+
     # The number of "system tracks", or "offset tracks" as they are officially
     # named, is usually just the couple necessary to boot CP/M, so we do not
     # examine the entire artifact.
@@ -246,7 +250,7 @@ class ProbeCpmFileSystem(ov.OctetView):
         tfn = this.tmpfile_for()
         with open(tfn.filename, "w", encoding="utf8") as self.log:
 
-            self.log.write("Geometry: " + str([self.this._key_min, self.this._key_max]) + "\n")
+            self.log.write("Geometry: " + str([self.this._records.key_min, self.this._records.key_max]) + "\n")
             self.report_dir_tracks()
 
             self.bnw = self.block_no_width()
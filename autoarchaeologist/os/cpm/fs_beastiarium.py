@@ -29,7 +29,7 @@ class CpmFSButler1a(fs_abc.CpmFileSystem):
     BLOCK_NO_WIDTH = 16
 
     def __init__(self, this, *args, **kwargs):
-        if this._key_max[0] < 140:
+        if this._records.key_max[0] < 140:
             raise fs_abc.Nonsense
         super().__init__(this, *args, **kwargs)
 
@@ -44,7 +44,7 @@ class CpmFSButler1b(fs_abc.CpmFileSystem):
     BLOCK_NO_WIDTH = 16
 
     def __init__(self, this, *args, **kwargs):
-        if this._key_max[0] < 140:
+        if this._records.key_max[0] < 140:
             raise fs_abc.Nonsense
         super().__init__(this, *args, **kwargs)
 
@@ -59,7 +59,7 @@ class CpmFSCr16(fs_abc.CpmFileSystem):
     BLOCK_NO_WIDTH = 16
 
     def __init__(self, this, *args, **kwargs):
-        if not 70 < this._key_max[0] < 77:
+        if not 70 < this._records.key_max[0] < 77:
             raise fs_abc.Nonsense
         super().__init__(this, *args, **kwargs)
 
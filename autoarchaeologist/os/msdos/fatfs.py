@@ -11,6 +11,7 @@
 
 from ...base import namespace
 from ...base import octetview as ov
+from ...base import wordview
 
 from .biosparamblock import *
 
@@ -170,12 +171,18 @@ class FAT12(ov.Octets):
 
     def __init__(self, tree, lo, width):
         super().__init__(tree, lo, width=width)
-        self.clusters = []
-        for i in range(0, width, 3):
-            j = ((self[i + 1] & 0xf) << 8) | self[i]
-            self.clusters.append(j)
-            j = (self[i + 1] >> 4) | (self[i + 2] << 4)
-            self.clusters.append(j)
+        # Pairs of clusters are packed LSB first in three octets
+        length = width + (-width % 3)
+        octets = self.this[lo:lo + length]
+        if len(octets) == length:
+            self.clusters = wordview.unpack(octets, 12, lsb_first=True)
+        else:
+            self.clusters = []
+            for i in range(0, width, 3):
+                j = ((self[i + 1] & 0xf) << 8) | self[i]
+                self.clusters.append(j)
+                j = (self[i + 1] >> 4) | (self[i + 2] << 4)
+                self.clusters.append(j)
         self.owner = [None] * len(self.clusters)
 
     def chain(self, owner,  first):
@@ -13,10 +13,17 @@ import subprocess
 import os
 import tempfile
 
+from ...base import dispatch
+
 class Compress():
 
     ''' A compress(1)'ed file '''
 
+    PRECONDITION = dispatch.Precondition(
+        magic=b'\x1f\x9d',
+        min_length=9,
+    )
+
     def __init__(self, this):
         if len(this) <= 8:
             return
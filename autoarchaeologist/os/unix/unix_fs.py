@@ -55,6 +55,7 @@
 
 import time
 
+from ...base import dispatch
 from ...base import namespace
 from ...base import octetview as ov
 
@@ -1031,6 +1032,9 @@ class FindUnixFs(ov.OctetView):
        ---------------------
     '''
 
+    # Brute-forces offsets
+    TIER = dispatch.EXPENSIVE
+
     def __init__(self, this):
 
         if this.top in this.parents and this.children:
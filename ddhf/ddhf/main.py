@@ -38,6 +38,8 @@ class DDHFExcavation(excavation.Excavation):
         if ddhf_bitstore_cache is None:
             ddhf_bitstore_cache = "/tmp/_bitstore_cache"
         self.ddhf_bitstore_cache = ddhf_bitstore_cache
+        self.argv_files = None
+        self.do_bitstore = None
         super().__init__(**kwargs)
 
         self.decorator = decorated_context.Decorator(self)
@@ -45,17 +47,25 @@ class DDHFExcavation(excavation.Excavation):
     def from_bitstore(self, *args, **kwargs):
         ''' Add artifacts from the Datamuseum.dk Bitstore '''
 
-    def from_argv(self):
-        ''' Process extra command line arguments '''
-        do_bitstore = len(sys.argv) == 1
+    def parse_argv(self):
+        ''' Parse extra command line arguments '''
+        self.do_bitstore = len(sys.argv) == 1
+        self.argv_files = []
         for fn in sys.argv[1:]:
             if fn in ("-h", "--help"):
                 self.usage()
             elif fn == "-b":
-                do_bitstore = True
+                self.do_bitstore = True
             else:
-                argv.argv_file(self, fn)
-        if do_bitstore:
+                self.argv_files.append(fn)
+
+    def from_argv(self):
+        ''' Process extra command line arguments '''
+        if self.argv_files is None:
+            self.parse_argv()
+        for fn in self.argv_files:
+            argv.argv_file(self, fn)
+        if self.do_bitstore:
             FromBitStore(
                 self,
                 self.ddhf_bitstore_cache,
@@ -87,6 +97,10 @@ class DDHFExcavation(excavation.Excavation):
         print("      (If deleted, they are downloaded again)")
         print("      Now:", self.ddhf_bitstore_cache)
         print()
+        print("   AUTOARCHAEOLOGIST_CHECKPOINT_INTERVAL")
+        print("      Seconds between checkpoints of the examination")
+        print("      (If the program dies, it resumes from the checkpoint)")
+        print()
         print("Bitstore artifacts;")
         print()
         if self.MEDIA_TYPES is not None:
@@ -103,6 +117,7 @@ class DDHFExcavation(excavation.Excavation):
 OK_ENVS = {
     "AUTOARCHAEOLOGIST_HTML_DIR": "html_dir",
     "AUTOARCHAEOLOGIST_BITSTORE_CACHE": "ddhf_bitstore_cache",
+    "AUTOARCHAEOLOGIST_CHECKPOINT_INTERVAL": "checkpoint_interval",
 }
 
 def main(job, html_subdir="tmp", **kwargs):
@@ -117,9 +132,11 @@ def main(job, html_subdir="tmp", **kwargs):
     kwargs.setdefault('download_limit', 1 << 20)
     ctx = job(**kwargs)
 
-    ctx.from_argv()
-
-    ctx.start_examination()
+    # Before resuming, the checkpoint must be of the same command line
+    ctx.parse_argv()
+    if not ctx.resume_checkpoint():
+        ctx.from_argv()
+        ctx.start_examination()
     baseurl = ctx.produce_html()
 
     print("Now point your browser at:")